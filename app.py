@@ -1,9 +1,18 @@
 import streamlit as st
+import pandas as pd
 from config import DEFAULT_DATA_DIR
-from lib_data import load_all_data
+from lib_data import load_all_data, metric_catalog, memory_report, request_refresh, dataset_status
+from lib_timing import PageTimer, timings_frame, export_json, recent
+from lib_ui import loading_progress, rerun_while_loading
+
+# Copy-on-Write: las vistas que entrega load_all_data nunca modifican el dataset compartido
+# (siempre activo desde pandas 3; es una opción global del proceso, por eso se fija acá)
+if int(pd.__version__.split(".")[0]) == 2:
+    pd.set_option("mode.copy_on_write", True)
 
 st.set_page_config(page_title="Tablero BCRA - Bancos", layout="wide")
 st.title("📊 Tablero BCRA – Bancos (multipágina)")
+timer = PageTimer("Inicio")
 
 # ---------- Estado compartido (defaults únicos en toda la app) ----------
 if "data_dir" not in st.session_state:
@@ -39,23 +48,28 @@ with st.sidebar:
     st.checkbox("Usar alias corto si existe", key="use_alias")
 
     st.divider()
-    if st.button("Limpiar caché de datos"):
-        st.cache_data.clear()
-        st.success("Caché limpiada. Volvé a ejecutar o cambiá un control.")
+    # el dataset se refresca solo; el botón adelanta la revisión sin vaciar la caché
+    if st.button("Buscar datos nuevos"):
+        request_refresh(st.session_state["data_dir"])
+        st.success("Revisando la fuente en segundo plano. Si hay datos nuevos se ven en el próximo rerun.")
 
 st.write("Usá el menú **Pages** para navegar: Series, Comparador y Calculadora.")
 
 # ---------- Carga de datos ----------
-df, seps, nomina_used = load_all_data(
-    data_dir=st.session_state["data_dir"],
-    nomina_path_in=st.session_state["nomina_path_in"],
-    include_aa=st.session_state["include_aa"],
-    use_alias=st.session_state["use_alias"],
-)
+with timer.span("carga"):
+    df, seps, nomina_used = load_all_data(
+        data_dir=st.session_state["data_dir"],
+        nomina_path_in=st.session_state["nomina_path_in"],
+        include_aa=st.session_state["include_aa"],
+        use_alias=st.session_state["use_alias"],
+        metrics=[],   # el resumen no usa métricas: cada página materializa solo las que muestra
+        partial=True, # primera carga: el resumen se arma con los meses ya leídos
+    )
 
 if df.empty:
     st.info("No encontré CSV en la carpeta indicada. Cargá datos en 'data/' o usá 'gdrive:<FOLDER_ID>'.")
 else:
+    loading_progress(df)
     # resumen
     try:
         min_mes = df["Mes"].min()
@@ -64,14 +78,50 @@ else:
     except Exception:
         rango_txt = "N/D"
 
+    version = df.attrs.get("version", {})
     st.success(
         f"Archivos: {df['__archivo'].nunique()} | "
         f"Entidades: {df['Etiqueta'].nunique()} | "
-        f"Rango de meses: {rango_txt}"
+        f"Rango de meses: {rango_txt} | "
+        f"Versión: {version.get('id', 'N/D')} (actualizada {str(version.get('actualizado', 'N/D')).replace('T', ' ')})"
     )
+    status = dataset_status(st.session_state["data_dir"])
+    if status["refrescando"] and not version.get("progreso"):  # en la primera carga ya está la barra
+        st.caption("🔄 Armando una versión nueva de los datos en segundo plano; se sigue mostrando la actual.")
+    elif status["error"]:
+        st.caption(f"⚠️ No se pudo revisar la fuente ({status['error']}); se muestra la última versión disponible.")
+    elif status["version"] != version.get("id"):
+        st.caption("Hay una versión más nueva de los datos: se verá en el próximo rerun.")
     with st.expander("Detalles técnicos"):
+        build = df.attrs.get("build")
+        st.write("Origen:", f"build precompilado {build['id']} ({build['creado']})" if build
+                 else "CSV de la carpeta (snapshot incremental)")
         st.write("Separadores detectados:", seps)
+        coerced = df.attrs.get("nan_coercidos", {})
+        st.write("Valores no numéricos convertidos a NaN:", coerced if coerced else "ninguno")
         st.write("Nómina usada:", nomina_used if nomina_used else "No encontrada (mostrando códigos).")
+        st.write(f"Métricas en memoria: {status['metricas_en_memoria']} de {status['metricas']} "
+                 f"({status['bytes_metricas'] / 2**20:.1f} MiB; el resto se lee al primer uso)")
+        mem = memory_report(df)
+        st.write(f"Memoria de los identificadores: {mem['bytes'].sum() / 2**20:.1f} MiB (bytes por columna):")
+        st.dataframe(mem, use_container_width=True, hide_index=True)
+        catalogo = metric_catalog(df)
+        if not catalogo.empty:
+            st.write("Catálogo de métricas (nombre canónico = encabezado del archivo más reciente):")
+            st.dataframe(catalogo, use_container_width=True, hide_index=True)
+
+        # tiempos: la carga se mide cuando se arma el dataset (luego queda en caché);
+        # las páginas guardan los tramos de su última ejecución en esta sesión
+        st.write("Tiempos de carga del dataset (ms):")
+        st.dataframe(timings_frame(df.attrs.get("tiempos", [])), use_container_width=True, hide_index=True)
+        for pagina, spans in st.session_state.get("tiempos", {}).items():
+            if spans:
+                st.write(f"Tiempos – {pagina} (última ejecución, ms):")
+                st.dataframe(timings_frame(spans), use_container_width=True, hide_index=True)
+        st.download_button("Exportar tiempos (JSON)", file_name="tiempos.json", mime="application/json",
+                           data=export_json({"carga": df.attrs.get("tiempos", []),
+                                             **st.session_state.get("tiempos", {}),
+                                             "proceso": recent()}))
 
 st.markdown("### Navegación")
 st.page_link("app.py", label="🏠 Inicio")
@@ -79,3 +129,5 @@ st.page_link("pages/01_Series.py", label="📈 Series")
 st.page_link("pages/02_Comparador.py", label="🧭 Comparador")
 st.page_link("pages/03_Calculadora.py", label="🧮 Calculadora")
 st.divider()
+
+rerun_while_loading(df, st.session_state["data_dir"])
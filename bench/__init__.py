@@ -0,0 +1,8 @@
+"""
+Benchmarks del dashboard.
+
+  python -m bench.run --months 120 --entities 80 --metrics 40
+
+Genera un dataset sintético con la forma de los archivos "resultado" del BCRA (bench.synth),
+mide las etapas de carga y las transformaciones de cada página, y escribe los resultados en JSON.
+"""
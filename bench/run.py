@@ -0,0 +1,214 @@
+# bench/run.py
+"""
+Mide las etapas de carga y las transformaciones de cada página sobre un dataset sintético.
+
+  python -m bench.run --months 120 --entities 80 --metrics 40 --repeat 3
+  python -m bench.run --months 120 --baseline bench/results/anterior.json   # sale con 1 si hay regresión
+
+Cada etapa se corre `repeat` veces; se reportan min/mediana en segundos. El JSON incluye
+versiones, CPU, parámetros y commit para poder comparar corridas entre máquinas y cambios.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bench.synth import generate
+
+# Streamlit avisa en cada llamada cacheada fuera de `streamlit run`
+logging.disable(logging.WARNING)
+
+import lib_data
+import lib_formula
+from lib_data import (ingest_local, load_all_data, build_cube, normalize_series, normalize_frame,
+                      list_numeric_columns, NORM_MODES)
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+def _timeit(fn, repeat: int, setup=None):
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+    return {"min": min(runs), "median": float(np.median(runs)), "runs": runs}
+
+def _clear_caches():
+    # hilos de refresco detenidos (y sus versiones olvidadas) y todas las capas cacheadas vacías
+    lib_data.stop_refreshers()
+    for loader in (lib_data._load_nomina, lib_data._load_all_data_shared, lib_data._load_cube,
+                   lib_data._row_order, lib_data._load_benchmarks, lib_data._load_transformed,
+                   lib_data.load_deflator):
+        loader.clear()
+    lib_formula._results.clear()
+
+def _base(src):
+    return lib_data.current_dataset(src).base
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def run(months=12, entities=80, metrics=40, repeat=3, seed=0, workdir=None) -> dict:
+    # siempre una carpeta nueva (dentro de workdir si se indica): es lo único que se borra al terminar
+    if workdir:
+        Path(workdir).mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix="bench-bcra-", dir=workdir))
+    saved = lib_data.SNAPSHOT_DIR
+    lib_data.SNAPSHOT_DIR = str(tmp / "snapshots")  # el snapshot del benchmark no pisa el de la app
+    try:
+        return _run(tmp, months, entities, metrics, repeat, seed)
+    finally:
+        _clear_caches()
+        lib_data.SNAPSHOT_DIR = saved
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def _run(tmp: Path, months, entities, metrics, repeat, seed) -> dict:
+    data_dir, snap_dir = tmp / "data", tmp / "snapshots"
+    t0 = time.perf_counter()
+    dataset = generate(data_dir, months=months, entities=entities, metrics=metrics, seed=seed)
+    dataset["generar_s"] = time.perf_counter() - t0
+    paths = sorted(data_dir.glob("*.csv"))
+    src = str(data_dir)
+
+    def cold():
+        shutil.rmtree(snap_dir, ignore_errors=True)
+        _clear_caches()
+
+    stages = {}
+    # ---------- Carga ----------
+    stages["ingesta_serial"] = _timeit(lambda: list(ingest_local(paths, "serial")), repeat)
+    stages["ingesta_pool"] = _timeit(lambda: list(ingest_local(paths)), repeat)
+    stages["base_fria"] = _timeit(lambda: _base(src), repeat, setup=cold)
+    stages["base_snapshot"] = _timeit(lambda: _base(src), repeat, setup=_clear_caches)
+    stages["nomina"] = _timeit(lambda: lib_data._load_nomina(src, "Nomina.txt"), repeat, setup=_clear_caches)
+    base = _base(src)
+    index, _ = lib_data._load_nomina(src, "Nomina.txt")
+    stages["proyeccion"] = _timeit(lambda: lib_data._project(base, index, True, True), repeat)
+    stages["load_all_data_frio"] = _timeit(lambda: load_all_data(src, "Nomina.txt", True, True), repeat, setup=cold)
+    stages["load_all_data_cache"] = _timeit(lambda: load_all_data(src, "Nomina.txt", True, True), repeat)
+
+    # carga progresiva: hasta la primera versión parcial (el mes más reciente); entre corridas se
+    # espera a que termine la carga en segundo plano antes de borrar el snapshot
+    def settle():
+        lib_data.current_dataset(src)
+        cold()
+    stages["primer_parcial_frio"] = _timeit(
+        lambda: load_all_data(src, "Nomina.txt", True, True, metrics=[], partial=True), repeat, setup=settle)
+    lib_data.current_dataset(src)
+
+    df, _, _ = load_all_data(src, "Nomina.txt", True, True)
+    num_cols = list_numeric_columns(df)
+    stages["cubo"] = _timeit(lambda: build_cube(df), repeat)
+    cube = build_cube(df)
+    # referencias de todos los grupos para todas las métricas (lo que precalcula el build)
+    grupos_ref, peso = lib_data.benchmark_groups(cube), lib_data._weight_metric(cube.metrics)
+    stages["referencias"] = _timeit(lambda: lib_data.compute_benchmarks(cube, grupos_ref, peso), repeat)
+
+    # ---------- Normalización ----------
+    metric = next((c for c in num_cols if c.startswith("R1 ")), num_cols[0])
+    # acceso proyectado: una métrica en frío (lectura del snapshot) y ya materializada
+    def una_metrica():
+        return load_all_data(src, "Nomina.txt", True, True, metrics=[metric], start=df["Mes"].max())
+    stages["una_metrica_fria"] = _timeit(una_metrica, repeat, setup=_clear_caches)
+    stages["una_metrica_cache"] = _timeit(una_metrica, repeat)
+    grupos = [s for _, s in df.groupby("Codigo_norm", observed=True)[metric]]
+    stages["normalize_series"] = _timeit(
+        lambda: [normalize_series(s, mode) for mode in NORM_MODES for s in grupos], repeat)
+
+    # ---------- Transformaciones por página ----------
+    last = cube.months[-1]
+    stages["series_topn"] = _timeit(
+        lambda: cube.sel(metrics=[metric]).cross_section(last, metric).nlargest(15), repeat)
+    # transformaciones temporales de todas las entidades y métricas (sin Real: necesita un índice)
+    stages["transformaciones"] = _timeit(
+        lambda: [lib_data.transform_values(cube.values, t, cube.months) for t in lib_data.TRANSFORMS[1:-1]], repeat)
+    stages["comparador"] = _timeit(lambda: normalize_frame(df, num_cols[:6], "Z-score"), repeat)
+
+    def calculadora():
+        lib_formula._results.clear()
+        lib_formula._compile_cached.cache_clear()
+        lib_formula.evaluate(cube, "(C_10002010 / C_10001000) * 100")
+        lib_formula.evaluate(cube, "rolling_mean(pct(C_10001000, 12), 3)")
+    stages["calculadora"] = _timeit(calculadora, repeat)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {"months": months, "entities": entities, "metrics": metrics,
+                       "repeat": repeat, "seed": seed},
+            "config": {"INGEST_MODE": lib_data.INGEST_MODE, "COMPACT_DTYPES": lib_data.COMPACT_DTYPES},
+        },
+        "dataset": dataset,
+        "stages": stages,
+    }
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """Etapas más lentas que baseline × tolerance (comparando mínimos)."""
+    slower = []
+    for name, st in result["stages"].items():
+        ref = baseline.get("stages", {}).get(name)
+        if ref and ref["min"] > 0:
+            ratio = st["min"] / ref["min"]
+            print(f"  {name:<22} {ref['min']:9.4f}s -> {st['min']:9.4f}s  x{ratio:5.2f}")
+            if ratio > tolerance:
+                slower.append(name)
+    return slower
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--months", type=int, default=12)
+    ap.add_argument("--entities", type=int, default=80)
+    ap.add_argument("--metrics", type=int, default=40)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workdir", help="dónde crear la carpeta temporal de los CSV sintéticos (solo se borra esa subcarpeta)")
+    ap.add_argument("--out", help="JSON de salida (default: bench/results/<fecha>_<meses>x<entidades>x<métricas>.json)")
+    ap.add_argument("--baseline", help="JSON de una corrida anterior para comparar")
+    ap.add_argument("--tolerance", type=float, default=1.25, help="regresión si una etapa es más lenta que baseline × tolerance")
+    args = ap.parse_args(argv)
+
+    result = run(args.months, args.entities, args.metrics, args.repeat, args.seed, args.workdir)
+    out = Path(args.out) if args.out else RESULTS_DIR / (
+        f"{datetime.now():%Y%m%d-%H%M%S}_{args.months}x{args.entities}x{args.metrics}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    ds = result["dataset"]
+    print(f"{ds['archivos']} archivos, {ds['filas']} filas, {ds['metricas']} métricas, {ds['bytes'] / 2**20:.1f} MiB")
+    for name, st in result["stages"].items():
+        print(f"  {name:<22} min {st['min']:9.4f}s  mediana {st['median']:9.4f}s")
+    print(f"Resultados: {out}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        slower = compare(result, baseline, args.tolerance)
+        if slower:
+            print(f"Regresión (> x{args.tolerance}): {', '.join(slower)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# bench/synth.py
+"""
+Generador de datos sintéticos con la forma real de los CSV mensuales del BCRA:
+una fila por entidad (más filas 'AA...' de agregados), una columna por métrica
+'CODIGO - Descripción (unidad)' y la columna 'fecha' YYYYMM.
+
+Cada archivo alterna separador (',' / ';' con coma decimal), encoding (utf-8 / latin-1)
+y algunos traen encabezados entrecomillados en varias líneas. Reproducible por semilla.
+"""
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+MESES = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto",
+         "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+
+# encabezados reales (los primeros 9 son montos/cantidades, el resto ratios)
+BASE_HEADERS = [
+    "C_10001000 - ACTIVO",
+    "C_10001030 - PRESTAMOS",
+    "C_10002010 - DEPOSITOS",
+    "C_10003000 - PATRIMONIO NETO",
+    "C_30000000 - CANTIDAD DE CUENTAS CORRIENTES",
+    "C_40000000 - CANTIDAD DE CUENTAS DE AHORRO",
+    "C_50000000 - CANTIDAD DE OPERACIONES A PLAZO FIJO",
+    "C_60000000 - CANTIDAD DE OPERACIONES POR PRESTAMOS",
+    "C_70000000 - DOTACION DE PERSONAL",
+    "C1 - Apalancamiento (en veces)",
+    "C2 - Pérdida Potencial de Cartera en Situación 2 a 5 (%)",
+    "C3 - Pérdida Potencial de Cartera en Situación 3 a 5 (%)",
+    "A11 - Cartera Irregular Sector Privado (%)",
+    "A12 - Participación Cartera Comercial Sector Privado (%)",
+    "A13 - Participación Cartera Consumo Sector Privado (%)",
+    "A14 - Previsiones sobre Cartera Irregular Total (%)",
+    "A16 - Cartera Irregular Consumo Sector Privado (%)",
+    "A17 - Cartera Irregular Comercial Sector Privado (%)",
+    "A21 - Posición de Previsiones Mín Sector Priv No Fciero (%)",
+    "A9 - Total Cartera Irregular / Total Financiaciones (%)",
+    "AG29 - Efectivo y Depósito en Bancos / Activo (%)",
+    "AG3 - Importancia de Cartera Vencida del Sector Privado (%)",
+    "E1 - Absorción de Gastos de Ad. con Volúmen de Negocio (%)",
+    "E2 - Margen de Rentabilidad Operat./Gastos de Estructura (%)",
+    "E4 - Depósitos por Empleado (en millones de pesos)",
+    "E5 - Financiaciones por Empleado (en millones de pesos)",
+    "R1 - Rendimiento Anual del Patrimonio ( ROE) (%)",
+    "R17 - Gastos en Personal / Gastos de Administración (%)",
+    "R2 - Rendimiento Ordinario del Patrimonio (%)",
+    "R8 - Tasa Implicita Préstamos Totales (%)",
+    "R9 - Tasa Implicita Depósitos Totales (%)",
+    "RG1 - Retorno sobre Activos ( ROA) (%)",
+    "RG15 - Retorno sobre Activos (ROA) antes Imp. de Gcias (%)",
+    "RG2_II - Margen Financiero en Términos de Activo (%)",
+    "RG3 - Cargos por Incobrabilidad / Activo  (%)",
+    "RG4_II - Resultados por Servicios / Activo (%)",
+    "RG5 - Gastos de Administración / Activo  (%)",
+    "L1 - Liq con tit c/cotiz+posición de CALL, LELIQ y LEFIs(%)",
+    "L8_II - Liquidez con títulos con cotiz (%)",
+    "L9 - LIQUIDEZ CON LELIQ, PASES y LEFI (%):",
+]
+_N_MONTOS = 9
+
+def metric_headers(n: int) -> list:
+    """Los primeros n encabezados; si se piden más que los reales se agregan ratios sintéticos."""
+    extra = [f"X{i} - Indicador sintético {i} (%)" for i in range(1, max(0, n - len(BASE_HEADERS)) + 1)]
+    return (BASE_HEADERS + extra)[:n]
+
+def _month_range(months: int, end: str):
+    return pd.date_range(end=pd.Timestamp(end), periods=months, freq="MS")
+
+def _file_name(mes: pd.Timestamp) -> str:
+    return f"resultado {MESES[mes.month - 1]} {mes.year % 100:02d}.csv"
+
+def _dialect(i: int):
+    # (separador, decimal, encoding, encabezados multilínea) según el índice del archivo
+    sep, dec = ((",", "."), (";", ","))[i % 2]
+    enc = "latin-1" if i % 3 == 2 else "utf-8"
+    return sep, dec, enc, i % 4 == 3
+
+def generate(out_dir, months: int = 12, entities: int = 80, metrics: int = 40, aa_rows: int = 11,
+             end: str = "2025-04-01", missing: float = 0.02, seed: int = 0) -> dict:
+    """
+    Escribe `months` CSV mensuales y Nomina.txt en out_dir.
+    Devuelve un resumen {archivos, filas, entidades, metricas, bytes}.
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    codes = [f"{c:05d}" for c in np.sort(rng.choice(np.arange(1, 100000), size=entities, replace=False))]
+    aa = [f"AA{c:03d}" for c in range(0, aa_rows * 10, 10)]
+    headers = metric_headers(metrics)
+    n_rows, n_metrics = len(codes) + len(aa), len(headers)
+    montos = np.arange(n_metrics) < _N_MONTOS
+
+    # nivel por fila y métrica; cada mes es un paseo aleatorio multiplicativo sobre ese nivel
+    level = np.where(montos, rng.lognormal(18, 2, (n_rows, n_metrics)).round(),
+                     rng.uniform(0, 60, (n_rows, n_metrics)))
+    level[:, montos & (np.arange(n_metrics) >= 4)] /= 1e4  # cantidades y dotación, no pesos
+    steps = rng.normal(0.01, 0.03, (months, n_rows, n_metrics))
+    values = level * np.exp(np.cumsum(steps, axis=0))
+    values[:, :, montos] = values[:, :, montos].round()
+    values[rng.random(values.shape) < missing] = np.nan
+
+    size = 0
+    for i, mes in enumerate(_month_range(months, end)):
+        sep, dec, enc, multiline = _dialect(i)
+        cols = [h.replace(" - ", " -\n", 1) if multiline and j % 5 == 0 else h for j, h in enumerate(headers)]
+        df = pd.DataFrame(values[i], columns=cols)
+        df.insert(0, "código de la entidad", codes + aa)
+        df["fecha"] = mes.strftime("%Y%m")
+        path = out / _file_name(mes)
+        df.to_csv(path, sep=sep, decimal=dec, encoding=enc, index=False, float_format="%.2f")
+        size += path.stat().st_size
+
+    nomina = pd.DataFrame({"codigo": codes,
+                           "nombre": [f"BANCO SINTÉTICO {c} S.A." for c in codes],
+                           "alias": [f"SINT{c}" if k % 4 else "" for k, c in enumerate(codes)]})
+    nomina.to_csv(out / "Nomina.txt", sep="\t", header=False, index=False, encoding="latin-1",
+                  quoting=1, lineterminator="\r\n")
+    return {"archivos": months, "filas": months * n_rows, "entidades": entities,
+            "metricas": n_metrics, "bytes": size}
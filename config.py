@@ -1 +1,66 @@
 DEFAULT_DATA_DIR = "gdrive:1rpOOCyJ15Xo2tYu9X6LiWE_Nh3CVVrPT"
+
+# Snapshot columnar (Parquet) del consolidado; se actualiza solo con meses nuevos/modificados
+SNAPSHOT_DIR = ".cache/snapshots"
+
+# Descargas desde Google Drive
+DRIVE_MAX_WORKERS = 8                  # descargas concurrentes
+DRIVE_MAX_RETRIES = 4                  # reintentos con backoff ante 429/5xx/errores de red
+DRIVE_CHUNK_SIZE = 32 * 1024 * 1024    # un CSV mensual entra en un solo request
+DRIVE_TIMEOUT_S = 60
+
+# Espejo local de carpetas gdrive: (solo se descargan archivos nuevos o modificados)
+DRIVE_MIRROR_DIR = ".cache/drive"
+
+# Calculadora: resultados de fórmulas cacheados por proceso (compartidos entre sesiones)
+FORMULA_CACHE_SIZE = 64
+
+# Tipos compactos del consolidado en memoria: identificadores como category y métricas en float32
+# cuando no cambian a COMPACT_DECIMALS decimales (False = object/float64 como en los CSV)
+COMPACT_DTYPES = True
+COMPACT_DECIMALS = 4
+
+# Ingesta de CSV locales: "process" (un core por archivo), "thread" o "serial"
+INGEST_MODE = "process"
+INGEST_MAX_WORKERS = None              # None = os.cpu_count()
+INGEST_MIN_FILES = 4                   # con menos archivos no conviene levantar un pool
+
+# Tiempos por etapa (carga y páginas): se registran en el logger "bcra.timing" como JSON;
+# con TIMING_LOG_PATH además se agregan a ese archivo (una línea JSON por tramo)
+TIMING_LOG_PATH = None                 # ej. ".cache/timing.jsonl"
+TIMING_BUFFER = 2000                   # últimos tramos que se conservan en memoria por proceso
+
+# Gráficos de líneas: WebGL por encima de CHART_WEBGL_POINTS puntos; con CHART_DOWNSAMPLE las
+# series largas se reducen con LTTB para no enviar más de CHART_MAX_POINTS puntos al navegador
+CHART_WEBGL_POINTS = 2000
+CHART_DOWNSAMPLE = True
+CHART_MAX_POINTS = 20000               # tope total, repartido entre las series del gráfico
+
+# Tablas paginadas: solo se envía al navegador la página visible
+TABLE_PAGE_SIZES = [25, 50, 100, 250]
+TABLE_PAGE_SIZE = 50
+
+# Snapshot precompilado con `python -m lib_data build --source data/ --out snapshot/`:
+# si existe un build para la carpeta de datos, la app lo carga directamente (sin leer CSV)
+BUILD_DIR = "snapshot"
+BUILD_KEEP = 3                         # builds anteriores que se conservan
+
+# Refresco en segundo plano: cada REFRESH_INTERVAL_S se revisa la fuente (build vigente, carpeta
+# local o listado de Drive) y, si cambió, se arma la versión nueva sin bloquear a las sesiones
+REFRESH_INTERVAL_S = 300               # 0 = solo a pedido (botón "Buscar datos nuevos")
+REFRESH_MAX_SOURCES = 4                # carpetas con versión y hilo propios; la menos usada se descarta
+
+# Carga inicial progresiva: mientras se leen los CSV (el mes más reciente primero) las páginas
+# muestran los meses ya leídos y se vuelven a ejecutar hasta que la carga termina
+STREAM_PUBLISH_S = 1.0                 # cada cuánto se publica una versión parcial
+STREAM_RERUN_S = 1.5                   # cada cuánto se actualiza una página con datos parciales
+DRIVE_STREAM_BATCH = 12                # Drive sin snapshot: primero el mes más reciente, después de a 12
+
+# Referencias en Series y Comparador: por mes y métrica, cuartiles, mediana y media ponderada por
+# activo de todas las entidades, de cada grupo de pares y de las filas 'AA...' de la nómina
+BENCHMARK_WEIGHT = "C_10001000"        # código de la métrica de peso (ACTIVO)
+PEER_GROUPS = {}                       # nombre -> códigos de entidad, ej. {"Públicos": ["00011", "00014", "00007"]}
+
+# Valores reales (transformación "Real" en Series, Comparador y Calculadora): índice de precios
+# mensual en CSV, con el mes (YYYYMM o fecha) en la primera columna y el índice en la segunda
+DEFLATOR_PATH = None                   # ej. "data/ipc.csv"; sin índice no se ofrece la transformación
@@ -3,13 +3,46 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from pathlib import Path
+from dataclasses import dataclass, field, replace
 from datetime import datetime
+import csv
+import functools
+import hashlib
+import itertools
+import json
 import io
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import (SNAPSHOT_DIR, DRIVE_MIRROR_DIR, DRIVE_MAX_WORKERS, DRIVE_MAX_RETRIES,
+                    DRIVE_CHUNK_SIZE, DRIVE_TIMEOUT_S, COMPACT_DTYPES, COMPACT_DECIMALS,
+                    INGEST_MODE, INGEST_MAX_WORKERS, INGEST_MIN_FILES, BUILD_DIR, BUILD_KEEP,
+                    REFRESH_INTERVAL_S, REFRESH_MAX_SOURCES, STREAM_PUBLISH_S, DRIVE_STREAM_BATCH, BENCHMARK_WEIGHT, PEER_GROUPS,
+                    DEFLATOR_PATH)
 
 # === Google Drive ===
+import httplib2
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+from googleapiclient.http import HttpRequest, MediaIoBaseDownload
+
+from lib_timing import span, record, collect
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)  # CLI: sin los avisos de caché de Streamlit fuera de `streamlit run`
 
 # ---------- helpers comunes ----------
 def find_col(cols, needle):
@@ -31,29 +64,191 @@ def parse_fecha_value(val):
             pass
     return pd.to_datetime(s, errors="coerce")
 
-def _to_num_series(col):
-    # convierte inteligentemente valores con % y separadores de miles
-    s = col.astype(str).str.replace('\u00a0','', regex=False).str.strip()
-    s = s.str.replace('%','', regex=False)
-    a = pd.to_numeric(s.str.replace('.','', regex=False).str.replace(',','.', regex=False), errors='coerce')
-    b = pd.to_numeric(s.str.replace(',','', regex=False), errors='coerce')
-    return a.fillna(b)
-
-def try_read_csv_local(path: Path, encodings=("utf-8", "latin-1"), seps=(";", ",", "\t")):
-    for enc in encodings:
-        for sep in seps:
+_MESES_ES = {"enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6,
+              "julio": 7, "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10,
+              "noviembre": 11, "diciembre": 12}
+
+def mes_from_filename(name: str):
+    """Infere el mes desde el nombre del archivo ('resultado Mayo 24.csv', '2024-03.csv')."""
+    stem = Path(str(name)).stem.lower()
+    m = re.search(r"(?<!\d)(\d{4})[-_ ]?(\d{2})(?!\d)", stem)
+    if m and 1 <= int(m.group(2)) <= 12:
+        return pd.Timestamp(int(m.group(1)), int(m.group(2)), 1)
+    month = next((n for mes, n in _MESES_ES.items() if re.search(rf"\b{mes}\b", stem)), None)
+    year = re.search(r"(?<!\d)(\d{4}|\d{2})(?!\d)", stem)
+    if month is None or year is None:
+        return pd.NaT
+    y = int(year.group(1))
+    return pd.Timestamp(y + 2000 if y < 100 else y, month, 1)
+
+def _recent_first(items, name=str, when=None) -> list:
+    """
+    Archivos del mes más reciente al más antiguo. El mes sale del nombre; si el nombre no lo trae
+    con año ('resultado Abril.csv') se usa when(item): el mes del primer registro (sniff_month) o el
+    modifiedTime de Drive. Sin ninguno de los dos, al final.
+    """
+    def key(item):
+        mes = mes_from_filename(name(item))
+        if pd.isna(mes) and when is not None:
+            mes = when(item)
+        return pd.Timestamp.min if pd.isna(mes) else mes
+    return sorted(items, key=key, reverse=True)
+
+def parse_mes_series(s: pd.Series, archivo: str = None) -> pd.Series:
+    """
+    Versión vectorizada de parse_fecha_value: parsea solo los valores únicos (YYYYMM con o sin
+    comillas, fechas ISO) y los expande a todas las filas. El resultado queda en el día 1 del mes.
+    Lo que no se pueda parsear se completa con el mes inferido del nombre de archivo.
+    """
+    codes, uniques = pd.factorize(s)
+    u = pd.Series(uniques, dtype=object).astype(str).str.strip().str.replace(r"[\"']", "", regex=True)
+    ym = u.str.extract(r"^(\d{4})(\d{2})")
+    mes = pd.to_datetime(ym[0] + ym[1], format="%Y%m", errors="coerce")
+    for i in np.flatnonzero(mes.isna().to_numpy()):
+        mes.iloc[i] = pd.to_datetime(u.iloc[i], errors="coerce")
+    mes = mes.dt.to_period("M").dt.to_timestamp()
+    out = pd.Series(np.append(mes.to_numpy(), np.datetime64("NaT"))[codes], index=s.index)
+    if archivo is not None and out.isna().any():
+        out = out.fillna(mes_from_filename(archivo))
+    return out
+
+def detect_num_convention(values) -> tuple:
+    """
+    Detecta (decimal, miles) a partir de una muestra de valores de texto.
+    '1.234,50' -> (',', '.'); '1,234.50' -> ('.', ','); '1.234' solo (ambiguo) -> ('.', ',').
+    """
+    votes = {".": 0, ",": 0}
+    for v in values:
+        v = str(v)
+        if "." in v and "," in v:
+            votes["," if v.rfind(",") > v.rfind(".") else "."] += 1
+            continue
+        for sep, other in ((".", ","), (",", ".")):
+            n = v.count(sep)
+            if n > 1:
+                votes[other] += 1  # '1.234.567': el punto es de miles
+            elif n == 1 and not re.search(rf"\{sep}\d{{3}}$", v):
+                votes[sep] += 1    # '12,5' / '3.02': separador decimal
+            # '1.234' / '1,234' solos son ambiguos y no votan
+    decimal = "," if votes[","] > votes["."] else "."
+    return decimal, ("." if decimal == "," else ",")
+
+def _num_clean(col):
+    s = col if col.dtype == object or pd.api.types.is_string_dtype(col) else col.astype(str)
+    return s.str.replace("[\\s\u00a0%]", "", regex=True)
+
+def _to_num_series(col, decimal=None, thousands=None):
+    # convierte valores con % y separadores de miles en una sola pasada, con la convención
+    # detectada (o la indicada para todo el archivo)
+    s = _num_clean(col)
+    if decimal is None:
+        decimal, thousands = detect_num_convention(s.dropna().head(200))
+    return _parse_num(s, decimal, thousands)
+
+def _parse_num(s, decimal, thousands):
+    # s ya pasado por _num_clean
+    if thousands:
+        s = s.str.replace(thousands, "", regex=False)
+    if decimal != ".":
+        s = s.str.replace(decimal, ".", regex=False)
+    return pd.to_numeric(s, errors="coerce").astype("float64")
+
+# ---------- Lectura de CSV (dialecto detectado una sola vez) ----------
+SNIFF_BYTES = 64 * 1024
+_SEP_NAMES = {";": "punto y coma", ",": "coma", "\t": "tab"}
+
+def sniff_dialect(sample: bytes, seps=(";", ",", "\t")):
+    """
+    Detecta encoding y separador a partir de los primeros bytes del archivo.
+    Respeta campos entre comillas con saltos de línea (encabezados multi-línea).
+    """
+    if sample.startswith(b"\xef\xbb\xbf"):
+        encoding = "utf-8-sig"
+    else:
+        try:
+            sample.decode("utf-8")
+            encoding = "utf-8"
+        except UnicodeDecodeError as e:
+            # un carácter multibyte cortado al final de la muestra no invalida utf-8
+            encoding = "utf-8" if e.start >= len(sample) - 3 and len(sample) >= SNIFF_BYTES else "latin-1"
+    text = sample.decode(encoding, errors="ignore")
+    if len(sample) >= SNIFF_BYTES:
+        text = text[:text.rfind("\n") + 1] or text  # descartar el último registro (incompleto)
+
+    best, best_score = None, 0
+    for sep in seps:
+        try:
+            rows = list(itertools.islice(csv.reader(io.StringIO(text), delimiter=sep, quotechar='"'), 50))
+        except csv.Error:
+            continue
+        if not rows or len(rows[0]) < 3:
+            continue
+        width = len(rows[0])
+        score = sum(1 for r in rows if len(r) == width)
+        if score > best_score:
+            best, best_score = sep, score
+    return {"encoding": encoding, "sep": best}
+
+def dialect_label(dialect) -> str:
+    if not dialect:
+        return ","
+    if isinstance(dialect, str):
+        return dialect
+    sep = dialect.get("sep")
+    return f"{_SEP_NAMES.get(sep, repr(sep))} · {dialect.get('encoding')} · {dialect.get('engine')}"
+
+def _read_csv_sniffed(src, seps=(";", ",", "\t")):
+    """src: ruta o bytes. Devuelve (df, dialecto) con un único parseo completo (motor C)."""
+    if isinstance(src, (bytes, bytearray)):
+        sample = bytes(src[:SNIFF_BYTES])
+        open_src = lambda: io.BytesIO(src)
+    else:
+        with open(src, "rb") as fh:
+            sample = fh.read(SNIFF_BYTES)
+        open_src = lambda: src
+    dialect = sniff_dialect(sample, seps)
+    if dialect["sep"] is not None:
+        for enc in dict.fromkeys([dialect["encoding"], "latin-1"]):
             try:
-                df = pd.read_csv(path, sep=sep, dtype=str, encoding=enc, engine="python")
-                if df.shape[1] >= 3:
-                    return df, sep
+                df = pd.read_csv(open_src(), sep=dialect["sep"], dtype=str, encoding=enc,
+                                 quotechar='"', engine="c")
+            except UnicodeDecodeError:
+                continue  # bytes no-utf8 más allá de la muestra
             except Exception:
-                continue
+                break
+            if df.shape[1] >= 3:
+                return df, {**dialect, "encoding": enc, "engine": "c"}
+            break
+    # último recurso: sniff de pandas (motor python)
     try:
-        df = pd.read_csv(path, sep=None, engine="python", dtype=str)
-        return df, None
+        df = pd.read_csv(open_src(), sep=None, engine="python", dtype=str, encoding=dialect["encoding"])
+        return df, {**dialect, "sep": None, "engine": "python"}
     except Exception:
         return None, None
 
+def try_read_csv_local(path: Path, seps=(";", ",", "\t")):
+    return _read_csv_sniffed(path, seps)
+
+def sniff_month(path) -> pd.Timestamp:
+    """Mes del primer registro de un CSV (columna fecha) leyendo solo su comienzo; NaT si no se puede."""
+    try:
+        with open(path, "rb") as fh:
+            sample = fh.read(SNIFF_BYTES)
+        dialect = sniff_dialect(sample)
+        if dialect["sep"] is None:
+            return pd.NaT
+        rows = csv.reader(io.StringIO(sample.decode(dialect["encoding"], errors="ignore")),
+                          delimiter=dialect["sep"], quotechar='"')
+        header = next(rows, [])
+        col = next((i for i, c in enumerate(header) if "fecha" in c.lower()), None)
+        row = next(rows, [])
+    except (OSError, csv.Error):
+        return pd.NaT
+    if col is None or len(row) <= col:
+        return pd.NaT
+    mes = pd.Timestamp(parse_fecha_value(row[col]))
+    return pd.NaT if pd.isna(mes) else mes.to_period("M").to_timestamp()
+
 # ---------- Normalización de códigos de entidad ----------
 def normalize_codigo_entidad(x: str) -> str:
     if x is None:
@@ -66,19 +261,26 @@ def normalize_codigo_entidad(x: str) -> str:
     digits = "".join(ch for ch in s if ch.isdigit())
     return digits.zfill(5) if digits else s
 
+def normalize_codigo_series(s: pd.Series) -> pd.Series:
+    """normalize_codigo_entidad vectorizado: se calcula una vez por código distinto y se mapea a las filas."""
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    norm = np.array([normalize_codigo_entidad(u) for u in uniques], dtype=object)
+    return pd.Series(norm[codes] if len(norm) else np.array([], dtype=object), index=s.index, name=s.name)
+
 # ---------- Nómina ----------
-@st.cache_data(show_spinner=False)
+# sin caché propia: la lee _load_nomina una vez por versión (una nómina editada cambia la huella)
 def load_nomina_map(candidates, encoding="latin-1"):
     for c in candidates:
         p = Path(c)
         if p.exists():
             df = pd.read_csv(p, sep="\t", header=None, dtype=str, encoding=encoding, quotechar='"',
                              names=["codigo", "nombre", "alias"])
-            df["codigo_norm"] = df["codigo"].apply(normalize_codigo_entidad)
+            df["codigo_norm"] = normalize_codigo_series(df["codigo"])
             return df[["codigo_norm", "nombre", "alias"]], str(p)
     return pd.DataFrame(columns=["codigo_norm", "nombre", "alias"]), ""
 
 # ---------- Google Drive: cliente y utilidades ----------
+@st.cache_resource(show_spinner=False)
 def _drive_credentials():
     # En Streamlit Cloud: definir en Secrets -> gdrive_service_account
     info = st.secrets.get("gdrive_service_account", None)
@@ -87,143 +289,944 @@ def _drive_credentials():
     scopes = ['https://www.googleapis.com/auth/drive.readonly']
     return service_account.Credentials.from_service_account_info(dict(info), scopes=scopes)
 
-@st.cache_data(show_spinner=False)
+_drive_local = threading.local()
+
+def _drive_http():
+    # httplib2 no es thread-safe: cada hilo reutiliza su propia conexión keep-alive
+    http = getattr(_drive_local, "http", None)
+    if http is None:
+        http = AuthorizedHttp(_drive_credentials(), http=httplib2.Http(timeout=DRIVE_TIMEOUT_S))
+        _drive_local.http = http
+    return http
+
+def _drive_request(http, *args, **kwargs):
+    return HttpRequest(_drive_http(), *args, **kwargs)
+
+@st.cache_resource(show_spinner=False)
 def _drive_build():
+    # un único service por proceso; las requests usan el transporte del hilo que las ejecuta
     creds = _drive_credentials()
-    return build('drive', 'v3', credentials=creds, cache_discovery=False)
+    return build('drive', 'v3', credentials=creds, cache_discovery=False, requestBuilder=_drive_request)
 
-@st.cache_data(show_spinner=False)
-def drive_list_csvs(folder_id: str):
+def _drive_list(folder_id: str):
+    # sin caché: la sync del espejo y el refresco necesitan el listado actual
     service = _drive_build()
     q = f"'{folder_id}' in parents and trashed=false"
     files = []
     page_token = None
-    while True:
-        resp = service.files().list(
-            q=q,
-            pageSize=1000,
-            fields="nextPageToken, files(id,name,mimeType,modifiedTime)",
-            pageToken=page_token
-        ).execute()
-        files.extend(resp.get('files', []))
-        page_token = resp.get('nextPageToken')
-        if not page_token:
-            break
+    with span("drive_listado"):
+        while True:
+            resp = service.files().list(
+                q=q,
+                pageSize=1000,
+                fields="nextPageToken, files(id,name,mimeType,modifiedTime)",
+                pageToken=page_token
+            ).execute()
+            files.extend(resp.get('files', []))
+            page_token = resp.get('nextPageToken')
+            if not page_token:
+                break
     # Aceptamos CSV + TXT (por si nomina)
     csv_like = []
     for f in files:
         name_low = f["name"].lower()
-        if name_low.endswith(".csv") or name_low.endswith(".txt"):
-            csv_like.append(f)
+        if not (name_low.endswith(".csv") or name_low.endswith(".txt")):
+            continue
+        if not _safe_file_name(f["name"]):
+            warnings.warn(f"Se ignora el archivo de Drive {f['name']!r}: el nombre no es válido como archivo local")
+            continue
+        csv_like.append(f)
     return csv_like
 
-def drive_download_bytes(file_id: str) -> bytes:
-    service = _drive_build()
+def _safe_file_name(name: str) -> bool:
+    # el nombre de Drive se usa como ruta dentro del espejo: sin separadores ni '..'
+    return name not in ("", ".", "..") and not any(sep in name for sep in ("/", "\\", "\0")) and ":" not in name
+
+def _drive_month(f) -> pd.Timestamp:
+    # sin mes en el nombre: el de la última modificación en Drive (UTC, sin zona para comparar)
+    if not f.get("modifiedTime"):
+        return pd.NaT
+    return pd.Timestamp(f["modifiedTime"]).tz_convert(None).to_period("M").to_timestamp()
+
+def drive_download_bytes(file_id: str, service=None) -> bytes:
+    service = service or _drive_build()
     req = service.files().get_media(fileId=file_id)
     fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, req)
+    downloader = MediaIoBaseDownload(fh, req, chunksize=DRIVE_CHUNK_SIZE)
     done = False
     while not done:
-        _, done = downloader.next_chunk()
+        # reintenta 429/5xx y errores de red con backoff exponencial aleatorizado
+        _, done = downloader.next_chunk(num_retries=DRIVE_MAX_RETRIES)
     return fh.getvalue()
 
-def _read_csv_bytes(content: bytes):
-    # intenta varios separadores igual que en local
-    for sep in (";", ",", "\t"):
-        try:
-            df = pd.read_csv(io.BytesIO(content), sep=sep, dtype=str, engine="python")
-            if df.shape[1] >= 3:
-                return df, sep
-        except Exception:
-            pass
-    # sniff automático
-    df = pd.read_csv(io.BytesIO(content), sep=None, engine="python", dtype=str)
-    return df, None
+def drive_download_many(files, max_workers=None):
+    """Descarga en paralelo; entrega (file, bytes) a medida que terminan (bytes=None si falló)."""
+    if not files:
+        return
+    service = _drive_build()
+    workers = max(1, min(max_workers or DRIVE_MAX_WORKERS, len(files)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="drive") as pool:
+        futures = {pool.submit(drive_download_bytes, f["id"], service): f for f in files}
+        for fut in as_completed(futures):
+            try:
+                content = fut.result()
+            except Exception:
+                content = None
+            yield futures[fut], content
 
 def _read_nomina_bytes(content: bytes, encoding="latin-1"):
     return pd.read_csv(io.BytesIO(content), sep="\t", header=None, dtype=str, encoding=encoding, quotechar='"',
                        names=["codigo", "nombre", "alias"])
 
-# ---------- Carga desde Drive o local (auto) ----------
-def _load_all_data_from_drive(folder_id: str, include_aa=False, use_alias=True):
-    files = drive_list_csvs(folder_id)
-    if not files:
-        return pd.DataFrame(), [], "", None  # df, seps, nomina_used, drive_meta
+# ---------- Catálogo de métricas ----------
+# columnas de identificación del consolidado (todo lo demás es métrica)
+_ID_COLS = {"Fecha", "Mes", "Código de la entidad", "__archivo", "Nombre de entidad"}
+_HEADER_RE = re.compile(r"^\s*([A-Za-z][A-Za-z0-9_]*)\s+-\s+(.*?)\s*:?\s*$")
 
-    # detectar nomina si existe
-    nomina_file = None
-    for f in files:
-        if "nomina" in f["name"].lower() and f["name"].lower().endswith(".txt"):
-            nomina_file = f
-            break
+def metric_code(col: str) -> str:
+    """'C_10001000 - ACTIVO' -> 'C_10001000'; 'R1 - Rendimiento ... (%)' -> 'R1'."""
+    m = _HEADER_RE.match(str(col))
+    return m.group(1).upper() if m else str(col).strip()
 
-    # leer CSVs
-    dfs, used_seps = [], []
-    for f in files:
-        name_low = f["name"].lower()
-        if not name_low.endswith(".csv"):
-            continue
-        content = drive_download_bytes(f["id"])
+def parse_metric_header(col: str):
+    """Encabezado -> (código, descripción, unidad). La unidad es el último paréntesis: '(%)', '(en veces)'."""
+    m = _HEADER_RE.match(str(col))
+    if not m:
+        return str(col).strip(), str(col).strip(), None
+    desc, unit = m.group(2), None
+    u = re.search(r"\s*\(([^()]*)\)$", desc)
+    if u:
+        desc, unit = desc[:u.start()], u.group(1).strip()
+    return m.group(1).upper(), desc.strip(), unit
+
+def build_metric_catalog(files) -> list:
+    """
+    files: entradas por archivo con 'columnas' (encabezados de métricas) y 'mes' (último mes).
+    Un registro por código; el nombre canónico es el encabezado del archivo más reciente y el
+    orden es el de ese archivo (los códigos que ya no aparecen van al final).
+    """
+    catalog = {}
+    for entry in sorted(files, key=lambda e: e.get("mes") or "", reverse=True):
+        for col in entry.get("columnas", []):
+            code, desc, unit = parse_metric_header(col)
+            rec = catalog.get(code)
+            if rec is None:
+                catalog[code] = {"codigo": code, "columna": col, "descripcion": desc, "unidad": unit,
+                                 "variantes": [col], "archivos": 1,
+                                 "desde": entry.get("mes"), "hasta": entry.get("mes")}
+                continue
+            rec["archivos"] += 1
+            rec["desde"] = entry.get("mes") or rec["desde"]
+            if col not in rec["variantes"]:
+                rec["variantes"].append(col)
+    return list(catalog.values())
+
+def _conform(df: pd.DataFrame, catalog: list) -> pd.DataFrame:
+    # renombra cada métrica a su nombre canónico (por código) y aplica el orden único de columnas
+    canon = {rec["codigo"]: rec["columna"] for rec in catalog}
+    ren, seen = {}, set()
+    for c in df.columns:
+        code = metric_code(c)
+        if c not in _ID_COLS and code in canon and code not in seen:
+            ren[c] = canon[code]
+            seen.add(code)
+    df = df.rename(columns=ren)
+    ids = [c for c in df.columns if c in _ID_COLS]
+    extra = [c for c in df.columns if c not in _ID_COLS and c not in ren.values()]
+    return df.reindex(columns=ids + [rec["columna"] for rec in catalog] + extra)
+
+def metric_catalog(df: pd.DataFrame) -> pd.DataFrame:
+    """Catálogo (código, columna, descripción, unidad, variantes...) del dataset cargado."""
+    return pd.DataFrame(df.attrs.get("catalogo", []),
+                        columns=["codigo", "columna", "descripcion", "unidad", "variantes",
+                                 "archivos", "desde", "hasta"])
+
+# ---------- Preparación por archivo ----------
+def _prepare_frame(df: pd.DataFrame, name: str):
+    """Normaliza columnas clave, parsea Mes y convierte métricas de un archivo mensual."""
+    # encabezados entre comillas con saltos de línea -> una sola línea
+    df.columns = [re.sub(r"\s*\n\s*", " ", c.strip()) for c in df.columns]
+    # detectar columnas clave
+    col_fecha = find_col(df.columns, "fecha") or "Fecha"
+    col_entidad = (find_col(df.columns, "código de la entidad")
+                   or find_col(df.columns, "codigo de la entidad")
+                   or find_col(df.columns, "entidad")
+                   or "Código de la entidad")
+    ren = {}
+    if col_fecha in df.columns: ren[col_fecha] = "Fecha"
+    if col_entidad in df.columns: ren[col_entidad] = "Código de la entidad"
+    if ren: df = df.rename(columns=ren)
+    if "Código de la entidad" not in df.columns:
+        return None
+    if "Fecha" not in df.columns:
+        if pd.isna(mes_from_filename(name)):
+            return None
+        df["Fecha"] = pd.NA  # sin columna fecha: el mes sale del nombre de archivo
+    df["__archivo"] = name
+    t0 = time.perf_counter()
+    df["Mes"] = parse_mes_series(df["Fecha"], name)
+    t1 = time.perf_counter()
+
+    # convención decimal/miles: una sola detección por archivo sobre una muestra de todas las métricas
+    metric_cols = [c for c in df.columns if c not in _ID_COLS]
+    sample = pd.concat([_num_clean(df[c].dropna().head(50)) for c in metric_cols]) if metric_cols else []
+    decimal, thousands = detect_num_convention(sample)
+    coerced = {}
+    if metric_cols:
+        # todo el bloque de métricas en una sola pasada (columna tras columna) y de vuelta a columnas;
+        # coercidos = con texto antes de convertir y NaN después
+        s = _num_clean(pd.Series(df[metric_cols].to_numpy(dtype=object).ravel(order="F"), dtype="str"))
+        present = (s.notna() & (s != "")).to_numpy(dtype=bool, na_value=False)
+        values = _parse_num(s, decimal, thousands).to_numpy().reshape(len(metric_cols), len(df))
+        lost = (present.reshape(values.shape) & np.isnan(values)).sum(axis=1)
+        coerced = {c: int(n) for c, n in zip(metric_cols, lost) if n}
+        nums = dict(zip(metric_cols, values))
+        df = pd.DataFrame({c: nums[c] if c in nums else df[c] for c in df.columns}, index=df.index)
+    df.attrs["nan_coercidos"] = coerced
+    df.attrs["tiempos"] = {"fechas": t1 - t0, "numeros": time.perf_counter() - t1}
+    return df
+
+# ---------- Ingesta local (serial o en paralelo) ----------
+def _ingest_file(path: str):
+    """
+    Lee y prepara un CSV. Corre en los workers del pool: debe ser una función de módulo (picklable).
+    Un archivo que no se puede procesar se saltea con un aviso (queda en el manifest con 0 filas).
+    """
+    t0 = time.perf_counter()
+    try:
+        df, dialect = try_read_csv_local(Path(path))
+        t1 = time.perf_counter()
+        df = _prepare_frame(df, Path(path).name) if df is not None else None
+    except Exception as e:
+        warnings.warn(f"Se saltea {Path(path).name}: {type(e).__name__}: {e}")
+        return None, None
+    if df is not None:
+        # tiempos por archivo medidos en el worker; _consolidate los suma por etapa
+        df.attrs["tiempos"] = {"lectura_csv": t1 - t0, **df.attrs.get("tiempos", {})}
+    return df, dialect
+
+def ingest_local(paths, mode: str = None, max_workers: int = None):
+    """
+    Lectura + encabezados + conversión numérica de cada CSV, repartida en un pool de procesos o hilos.
+    Entrega (nombre, df preparado o None, dialecto) a medida que terminan; un CSV con errores se
+    entrega como None. Los procesos se inician con forkserver (o spawn), nunca con fork. Si el pool
+    no se puede usar (worker caído), los archivos que falten se procesan en serie.
+    """
+    paths = [str(p) for p in paths]
+    mode = mode or INGEST_MODE
+    workers = max(1, min(max_workers or INGEST_MAX_WORKERS or os.cpu_count() or 1, len(paths)))
+    done = set()
+    if mode in ("process", "thread") and workers > 1 and len(paths) >= INGEST_MIN_FILES:
         try:
-            df, sep_used = _read_csv_bytes(content)
-        except Exception:
-            continue
-        df.columns = [c.strip() for c in df.columns]
-        # detectar columnas clave
-        col_fecha = find_col(df.columns, "fecha") or "Fecha"
-        col_entidad = (find_col(df.columns, "código de la entidad")
-                       or find_col(df.columns, "codigo de la entidad")
-                       or find_col(df.columns, "entidad")
-                       or "Código de la entidad")
-        ren = {}
-        if col_fecha in df.columns: ren[col_fecha] = "Fecha"
-        if col_entidad in df.columns: ren[col_entidad] = "Código de la entidad"
-        if ren: df = df.rename(columns=ren)
-        if "Fecha" not in df.columns or "Código de la entidad" not in df.columns:
-            continue
-        df["__archivo"] = f["name"]
-        dfs.append(df)
-        used_seps.append(sep_used or ",")
+            if mode == "process":
+                # sin fork: el servidor de Streamlit tiene hilos (locks tomados en el padre)
+                start = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start))
+            else:
+                pool = ThreadPoolExecutor(max_workers=workers)
+            with pool:
+                futures = {pool.submit(_ingest_file, p): p for p in paths}
+                for fut in as_completed(futures):
+                    df, dialect = fut.result()
+                    done.add(futures[fut])
+                    yield Path(futures[fut]).name, df, dialect
+        except Exception as e:
+            warnings.warn(f"Ingesta en paralelo ({mode}) no disponible, se sigue en serie: {e}")
+    for p in paths:
+        if p not in done:
+            df, dialect = _ingest_file(p)
+            yield Path(p).name, df, dialect
+
+# ---------- Snapshot columnar incremental ----------
+# Se guarda el consolidado (antes de filtro AA y nómina) en Parquet junto a un manifest
+# con la huella de cada archivo fuente. Subir SNAPSHOT_VERSION si cambia el parseo.
+SNAPSHOT_VERSION = 5
+
+def _local_fingerprint(path: Path) -> str:
+    stat = path.stat()
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+def _snapshot_dir(source: str) -> Path:
+    return Path(SNAPSHOT_DIR) / hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+
+def _snapshot_manifest(sdir: Path, source: str) -> dict:
+    """Manifest del snapshot, o uno vacío si no hay snapshot válido."""
+    empty = {"version": SNAPSHOT_VERSION, "source": source, "files": {}}
+    try:
+        manifest = json.loads((sdir / "manifest.json").read_text(encoding="utf-8"))
+    except Exception:
+        return empty
+    if manifest.get("version") != SNAPSHOT_VERSION or manifest.get("source") != source:
+        return empty
+    return manifest
+
+def _snapshot_data(sdir: Path, manifest: dict, ids_only: bool = False):
+    """Consolidado del snapshot (o None). ids_only: solo identificadores; las métricas quedan en df.attrs["almacen"]."""
+    path = sdir / manifest.get("datos", "consolidado.parquet")
+    try:
+        if not ids_only:
+            return pd.read_parquet(path) if path.exists() else None
+        ids, store = _ColumnStore.open(path)
+    except Exception:
+        return None
+    ids.attrs["almacen"] = store
+    return ids
+
+def _snapshot_save(sdir: Path, manifest: dict, full: pd.DataFrame):
+    # cada escritura va a un archivo nuevo y el manifest pasa a apuntarlo (reemplazo atómico): el
+    # consolidado anterior puede seguir mapeado por un _ColumnStore, y en Windows un archivo
+    # mapeado no se puede reemplazar. Si falla (p.ej. disco de solo lectura) seguimos sin snapshot.
+    try:
+        sdir.mkdir(parents=True, exist_ok=True)
+        datos = f"consolidado-{time.time_ns()}.parquet"
+        full.to_parquet(sdir / datos, index=False)
+        tmp = sdir / "manifest.json.tmp"
+        tmp.write_text(json.dumps({**manifest, "datos": datos}, ensure_ascii=False, indent=1), encoding="utf-8")
+        tmp.replace(sdir / "manifest.json")
+    except Exception as e:
+        warnings.warn(f"No se pudo guardar el snapshot en {sdir}: {type(e).__name__}: {e}")
+        return
+    # los consolidados anteriores: los que sigan mapeados se borran en una escritura posterior
+    for old in [*sdir.glob("consolidado-*.parquet"), sdir / "consolidado.parquet"]:
+        if old.name != datos:
+            try:
+                old.unlink(missing_ok=True)
+            except OSError:
+                pass
+
+def _merge(dfs, catalog) -> pd.DataFrame:
+    # cada archivo se mapea al orden canónico de métricas antes de concatenar
+    full = pd.concat([_conform(d, catalog) for d in dfs], ignore_index=True)
+    return full.sort_values(["Mes", "Código de la entidad"], kind="mergesort").reset_index(drop=True)
+
+def _consolidate(source: str, entries, read_entries, lazy: bool = False, on_partial=None, month=None,
+                fingerprint=None):
+    """
+    Arma el consolidado reutilizando el snapshot en disco.
+    entries: lista de (nombre, huella) de los CSV de la fuente; huella None = se conoce recién al
+      leer el archivo (descargas) y la da fingerprint(nombre).
+    read_entries(nombres) -> iterable de (nombre, df preparado o None, dialecto), en cualquier orden;
+      solo recibe los archivos nuevos/modificados (ver ingest_local).
+    lazy: si el snapshot está al día se leen solo los identificadores y las métricas quedan
+      en df.attrs["almacen"] (ver _ColumnStore).
+    on_partial(df, leídos, total): recibe el consolidado parcial mientras se leen los archivos
+      (el mes más reciente primero), como mucho cada STREAM_PUBLISH_S segundos.
+    month(nombre): mes del archivo cuando el nombre no lo trae con año (orden de lectura, ver _recent_first).
+    Devuelve (df, separadores).
+    """
+    sdir = _snapshot_dir(source)
+    with span("snapshot_lectura"):
+        manifest = _snapshot_manifest(sdir, source)
+        prev = manifest["files"]
+        keep = [name for name, fp in entries if name in prev and prev[name]["fingerprint"] == fp]
+        ids_only = lazy and len(keep) == len(entries) == len(prev)  # sin archivos nuevos, modificados ni borrados
+        snap = _snapshot_data(sdir, manifest, ids_only) if keep else None
 
+    files, dfs = {}, []
+    if snap is not None and keep:
+        dfs.append(snap[snap["__archivo"].isin(keep)])
+    elif keep and any(prev[name].get("rows") for name in keep):
+        keep = []  # manifest sin datos: re-parsear todo
+    pending = {}
+    for name, fp in entries:
+        if name in keep:
+            files[name] = prev[name]
+        else:
+            pending[name] = fp
+    per_file = {}
+    published = None
+    with span("ingesta", archivos=len(pending)):
+        t_ingesta = time.perf_counter()
+        for done, (name, df, dialect) in enumerate(read_entries(_recent_first(pending, when=month)), 1):
+            if df is not None:
+                for stage, secs in df.attrs.pop("tiempos", {}).items():
+                    per_file[stage] = per_file.get(stage, 0.0) + secs
+            fp = pending[name] if pending[name] is not None else fingerprint(name)
+            files[name] = {"fingerprint": fp, "sep": dialect_label(dialect),
+                           "rows": 0 if df is None else len(df),
+                           "nan_coercidos": {} if df is None else df.attrs.get("nan_coercidos", {}),
+                           "columnas": [] if df is None else [c for c in df.columns if c not in _ID_COLS],
+                           "mes": None if df is None or df["Mes"].isna().all() else df["Mes"].max().strftime("%Y-%m")}
+            if df is not None:
+                dfs.append(df)
+            if (on_partial is not None and dfs and done < len(pending)
+                    and (published is None or time.perf_counter() - published >= STREAM_PUBLISH_S)):
+                catalog = build_metric_catalog(e for e in files.values() if e.get("rows"))
+                partial = _merge(dfs, catalog)
+                partial.attrs = {"catalogo": catalog}
+                on_partial(partial, done, len(pending))
+                published = time.perf_counter()
+        # suma de los tiempos por archivo (en paralelo puede superar al tiempo de "ingesta")
+        for stage, secs in per_file.items():
+            record(f"ingesta.{stage}", secs, start=t_ingesta, archivos=len(pending), suma_archivos=True)
+    changed = bool(pending) or set(prev) != set(files)
+
+    seps = [files[name]["sep"] for name, _ in entries if files.get(name, {}).get("rows")]
     if not dfs:
-        return pd.DataFrame(), [], "", {"folder_id": folder_id, "files": files}
+        return pd.DataFrame(), []
 
-    full = pd.concat(dfs, ignore_index=True)
-    full["Mes"] = full["Fecha"].apply(parse_fecha_value)
-    full = full.sort_values(["Mes", "Código de la entidad"], kind="mergesort").reset_index(drop=True)
+    # catálogo de métricas: nombre canónico y orden de columnas comunes a todos los archivos
+    catalog = build_metric_catalog(e for e in files.values() if e.get("rows"))
+    store = snap.attrs.get("almacen") if snap is not None else None
+    if not changed:
+        full = dfs[0].reset_index(drop=True)
+    else:
+        with span("consolidar", archivos=len(dfs)):
+            full = _merge(dfs, catalog)
+        manifest["files"] = files
+        manifest["catalogo"] = catalog
+        with span("snapshot_escritura"):
+            _snapshot_save(sdir, manifest, full)
+    # valores no vacíos que no se pudieron convertir a número, por columna (canónica)
+    canon = {rec["codigo"]: rec["columna"] for rec in catalog}
+    coerced = {}
+    for entry in files.values():
+        for c, n in entry.get("nan_coercidos", {}).items():
+            c = canon.get(metric_code(c), c)
+            coerced[c] = coerced.get(c, 0) + n
+    full.attrs = {"nan_coercidos": coerced, "catalogo": catalog}
+    if store is not None and not changed:
+        full.attrs["almacen"] = store
+    return full, seps
 
-    id_cols = {"Fecha", "Mes", "Código de la entidad", "__archivo", "Nombre de entidad"}
-    for c in [c for c in full.columns if c not in id_cols]:
-        full[c] = _to_num_series(full[c])
+# ---------- Métricas bajo demanda ----------
+# La base en memoria guarda solo los identificadores; cada métrica se lee del Parquet (snapshot o
+# build) la primera vez que se pide y queda en memoria para todas las sesiones del proceso.
+_KEY_COLS = _ID_COLS | {"Codigo_norm"}
 
-    if not include_aa:
-        full = full[~full["Código de la entidad"].astype(str).str.upper().str.startswith("AA")].copy()
+class _ColumnStore:
+    """Métricas de una versión del dataset: {columna: array de solo lectura alineado con la base}."""
+
+    def __init__(self, metrics, columns=None, parquet=None):
+        self.metrics = tuple(metrics)
+        self._cols = dict(columns or {})
+        self._file = parquet          # ParquetFile sobre un memory map: sigue válido si el archivo se reemplaza
+        self._lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        return self  # viaja en df.attrs: es un recurso compartido, no un valor
+
+    @classmethod
+    def open(cls, path):
+        """(identificadores, store) de un Parquet; las métricas todavía no se leen."""
+        pf = pq.ParquetFile(pa.memory_map(str(path)))
+        names = pf.schema_arrow.names
+        ids = pf.read(columns=[c for c in names if c in _KEY_COLS]).to_pandas()
+        return ids, cls([c for c in names if c not in _KEY_COLS], parquet=pf)
+
+    @classmethod
+    def split(cls, full: pd.DataFrame):
+        """(identificadores, store) de un consolidado ya en memoria."""
+        store = full.attrs.pop("almacen", None)
+        ids = [c for c in full.columns if c in _KEY_COLS]
+        if store is None:
+            metrics = [c for c in full.columns if c not in _KEY_COLS]
+            store = cls(metrics, {c: _readonly(full[c].to_numpy()) for c in metrics})
+        return full[ids], store
+
+    def loaded(self) -> list:
+        return list(self._cols)
+
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self._cols.values())
+
+    def get(self, names) -> dict:
+        """{métrica: array}; las que faltan se leen juntas del Parquet."""
+        missing = [n for n in names if n not in self._cols]
+        if missing:
+            with self._lock:
+                missing = [n for n in missing if n not in self._cols]
+                if missing:
+                    with span("metricas_lectura", metricas=len(missing)):
+                        frame = self._file.read(columns=missing).to_pandas()
+                        if COMPACT_DTYPES:
+                            frame = compact_frame(frame)
+                    for n in missing:
+                        self._cols[n] = _readonly(frame[n].to_numpy())
+        return {n: self._cols[n] for n in names}
+
+def _readonly(values: np.ndarray) -> np.ndarray:
+    values.flags.writeable = False
+    return values
+
+# ---------- Espejo local de Drive ----------
+# DRIVE_MIRROR_DIR/<folder_id> guarda la última copia de cada archivo y .mirror.json el id y
+# modifiedTime con que se bajó: solo se descargan archivos nuevos o con otro modifiedTime.
+def _mirror_open(folder_id: str, files, only=None):
+    """
+    Compara el espejo con el listado `files`: borra lo que ya no está en Drive (eliminado, en papelera
+    o renombrado) salvo con `only` (nombres a sincronizar, carga por lotes) y devuelve
+    (carpeta_espejo, sincronizados, pendientes de bajar del mes más reciente al más antiguo).
+    """
+    mirror = Path(DRIVE_MIRROR_DIR) / folder_id
+    mirror.mkdir(parents=True, exist_ok=True)
+    try:
+        prev = json.loads((mirror / ".mirror.json").read_text(encoding="utf-8"))
+    except Exception:
+        prev = {}
+
+    current = {f["id"]: f for f in files}
+    synced = {fid: e for fid, e in prev.items() if fid in current}
+
+    # podar: archivos borrados/en papelera o renombrados en Drive
+    names = {f["name"] for f in files}
+    for fid, e in prev.items() if only is None else ():
+        if fid not in current or e["name"] != current[fid]["name"]:
+            synced.pop(fid, None)
+            if e["name"] not in names:
+                (mirror / e["name"]).unlink(missing_ok=True)
 
-    # nomina
-    nomina_used = ""
-    if nomina_file is not None:
+    stale = [f for f in files
+             if (only is None or f["name"] in only)
+             and (synced.get(f["id"], {}).get("modifiedTime") != f.get("modifiedTime")
+                  or not (mirror / f["name"]).exists())]
+    return mirror, synced, _recent_first(stale, name=lambda f: f["name"], when=_drive_month)
+
+def _mirror_download(mirror: Path, synced: dict, stale):
+    """
+    Baja `stale` en paralelo y entrega (file, ruta en el espejo) a medida que termina cada descarga,
+    así quien consume parsea un archivo mientras siguen las demás. Si una descarga falla la ruta es
+    la copia anterior (o None) y se reintenta en la próxima sync. Al terminar guarda .mirror.json.
+    """
+    try:
+        with span("drive_descargas", archivos=len(stale)):
+            for f, content in drive_download_many(stale):
+                dest = mirror / f["name"]
+                if content is None or dest.resolve().parent != mirror.resolve():
+                    # _drive_list ya descarta los nombres inseguros; nunca se escribe fuera del espejo
+                    yield f, (dest if content is None and dest.exists() else None)
+                    continue
+                tmp = mirror / f".{f['name']}.tmp"
+                tmp.write_bytes(content)
+                tmp.replace(dest)
+                # mtime = modifiedTime de Drive: la huella local del snapshot queda estable
+                if f.get("modifiedTime"):
+                    ts = pd.Timestamp(f["modifiedTime"]).timestamp()
+                    os.utime(dest, (ts, ts))
+                synced[f["id"]] = {"name": f["name"], "modifiedTime": f.get("modifiedTime")}
+                yield f, dest
+    finally:
+        tmp = mirror / ".mirror.json.tmp"
+        tmp.write_text(json.dumps(synced, ensure_ascii=False, indent=1), encoding="utf-8")
+        tmp.replace(mirror / ".mirror.json")
+
+def _consolidate_drive(folder_id: str, files, lazy: bool = False, on_partial=None, only=None):
+    """
+    Sincroniza el espejo con el listado `files` y consolida sus CSV (ver _consolidate). Los archivos
+    que ya están en el espejo se leen con ingest_local; los que hay que bajar se parsean apenas llega
+    cada uno, mientras siguen las demás descargas. only: nombres a consolidar (carga por lotes).
+    """
+    mirror, synced, stale = _mirror_open(folder_id, files, only)
+    by_name = {f["name"]: f for f in files if f["name"].lower().endswith(".csv") and (only is None or f["name"] in only)}
+    download = {f["name"] for f in stale}
+    # huella None: se conoce recién al bajar el archivo (siempre se vuelve a leer)
+    entries = [(n, None if n in download else _local_fingerprint(mirror / n)) for n in sorted(by_name)]
+
+    def read_entries(names):
+        names = set(names)
+        yield from ingest_local([mirror / n for n in names - download])  # espejo al día, snapshot viejo
+        for f, path in _mirror_download(mirror, synced, stale):
+            if f["name"] in names:  # los .txt (nómina) solo se espejan
+                yield (f["name"], *_ingest_file(str(path))) if path is not None else (f["name"], None, None)
+
+    month = lambda n: sniff_month(mirror / n) if n not in download else _drive_month(by_name[n])
+    fingerprint = lambda n: _local_fingerprint(mirror / n) if (mirror / n).exists() else ""
+    return _consolidate(str(mirror.resolve()), entries, read_entries, lazy, on_partial, month, fingerprint)
+
+# ---------- Capas cacheadas: base -> nómina -> proyección ----------
+# Cambiar "Incluir AA" o "Usar alias" solo recalcula la proyección; la base (lectura, parseo,
+# conversión numérica, descargas) y la nómina quedan en caché por separado.
+def _drive_folder(data_dir):
+    if isinstance(data_dir, str) and data_dir.lower().startswith("gdrive:"):
+        return data_dir.split(":",1)[1].strip()
+    return None
+
+def _build_base(data_dir: str, lazy: bool = False, on_partial=None, files=None):
+    """
+    Consolidado numérico de la fuente, con filas AA y Codigo_norm. Devuelve (df, separadores).
+    lazy: con el snapshot al día devuelve solo identificadores (ver _consolidate).
+    on_partial(df, leídos, total): consolidados parciales durante la carga (ver _consolidate).
+    files: listado de Drive ya pedido en esta revisión (ver _source_state); None = se lista acá.
+    """
+    partial = None
+    if on_partial is not None:
+        def partial(df, done, total):
+            df["Codigo_norm"] = normalize_codigo_series(df["Código de la entidad"])
+            on_partial(df, done, total)
+
+    folder_id = _drive_folder(data_dir)
+    if folder_id is not None:
+        # modo Drive: un solo listado; se lee desde el espejo local sincronizado
+        if files is None:
+            files = _drive_list(folder_id)
+        if partial is not None:
+            _stream_drive(folder_id, files, partial)
+        full, used_seps = _consolidate_drive(folder_id, files, lazy, partial)
+    else:
+        p = Path(data_dir)
+        local = {f.name: f for f in sorted(p.glob("*.csv"))}
+        if not local:
+            return pd.DataFrame(), []
+        full, used_seps = _consolidate(str(p.resolve()),
+                                       [(name, _local_fingerprint(f)) for name, f in local.items()],
+                                       lambda names: ingest_local([local[name] for name in names]), lazy, partial,
+                                       month=lambda name: sniff_month(local[name]))
+    if full.empty:
+        return pd.DataFrame(), []
+
+    with span("codigo_norm"):
+        full["Codigo_norm"] = normalize_codigo_series(full["Código de la entidad"])
+    if COMPACT_DTYPES:
+        with span("tipos_compactos"):
+            full = compact_frame(full)
+    return full, used_seps
+
+def _stream_drive(folder_id: str, files, on_partial):
+    """
+    Primera carga de una carpeta de Drive (sin snapshot): baja y consolida por lotes del mes más
+    reciente al más antiguo (un archivo, después DRIVE_STREAM_BATCH) y publica cada lote como
+    parcial. Cada lote queda en el snapshot, así que la consolidación final solo lee el último.
+    """
+    source = str((Path(DRIVE_MIRROR_DIR) / folder_id).resolve())
+    if _snapshot_manifest(_snapshot_dir(source), source)["files"]:
+        return  # con snapshot la sync incremental ya es rápida
+    csvs = _recent_first([f for f in files if f["name"].lower().endswith(".csv")],
+                         name=lambda f: f["name"], when=_drive_month)
+    for end in range(1, len(csvs), max(1, DRIVE_STREAM_BATCH)):
+        batch = {f["name"] for f in csvs[:end]}
+        full, _ = _consolidate_drive(folder_id, files, only=batch)
+        if not full.empty:
+            on_partial(full, len(batch), len(csvs))
+
+def nomina_index(nom_df: pd.DataFrame) -> dict:
+    """codigo_norm -> (nombre, alias); ante códigos repetidos vale la primera fila."""
+    nom_df = nom_df.drop_duplicates("codigo_norm")
+    clean = lambda v: None if pd.isna(v) else v
+    return {c: (clean(n), clean(a)) for c, n, a in
+            zip(nom_df["codigo_norm"], nom_df["nombre"], nom_df["alias"])}
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _load_nomina(data_dir: str, nomina_path_in: str, version: str = None):
+    """Índice de nómina codigo_norm -> (nombre, alias) y origen usado (se relee con cada versión)."""
+    prebuilt = _load_prebuilt_nomina(data_dir, nomina_path_in)
+    nom_df, used = prebuilt if prebuilt is not None else _read_nomina_source(data_dir, nomina_path_in)
+    return nomina_index(nom_df), used
+
+def _read_nomina_source(data_dir: str, nomina_path_in: str):
+    folder_id = _drive_folder(data_dir)
+    if folder_id is None:
+        return load_nomina_map([
+            nomina_path_in,
+            Path(data_dir) / nomina_path_in,
+            "Nomina.txt",
+            Path(data_dir) / "Nomina.txt",
+        ])
+
+    # si se especificó nomina gdrive:<id>, forzamos esa
+    if isinstance(nomina_path_in, str) and nomina_path_in.lower().startswith("gdrive:"):
         try:
-            nbytes = drive_download_bytes(nomina_file["id"])
-            nom_df = _read_nomina_bytes(nbytes)
-            nom_df["codigo_norm"] = nom_df["codigo"].apply(normalize_codigo_entidad)
-            nomina_used = f"drive:{nomina_file['name']}"
+            fid = nomina_path_in.split(":",1)[1].strip()
+            nom_df = _read_nomina_bytes(drive_download_bytes(fid))
+            nom_df["codigo_norm"] = normalize_codigo_series(nom_df["codigo"])
+            return nom_df[["codigo_norm", "nombre", "alias"]], f"drive:{fid}"
         except Exception:
-            nom_df = pd.DataFrame(columns=["codigo_norm", "nombre", "alias"])
+            pass
+    # si no, la nómina que haya en la carpeta (ya espejada por la capa base)
+    mirror = Path(DRIVE_MIRROR_DIR) / folder_id
+    for f in sorted(mirror.glob("*.txt")):
+        if "nomina" in f.name.lower():
+            nom_df, used = load_nomina_map([str(f)])
+            return nom_df, (f"drive:{f.name}" if used else "")
+    return pd.DataFrame(columns=["codigo_norm", "nombre", "alias"]), ""
+
+def _entity_label(raw, index: dict, use_alias: bool):
+    # nombre (o alias si se pide y no está vacío); sin nómina queda el código tal cual vino
+    nombre, alias = index.get(normalize_codigo_entidad(raw), (None, None))
+    if use_alias and alias is not None and str(alias).strip() != "":
+        return alias
+    return nombre if nombre is not None else raw
+
+def _project(base: pd.DataFrame, index: dict, include_aa: bool, use_alias: bool):
+    # proyección de presentación: filtro AA + Etiqueta resuelta por código distinto (sin merge)
+    full = base
+    if not include_aa:
+        full = full[~full["Código de la entidad"].astype(str).str.upper().str.startswith("AA")]
+    codes, uniques = pd.factorize(full["Código de la entidad"], use_na_sentinel=False)
+    labels = [_entity_label(u, index, use_alias) for u in uniques]
+    if COMPACT_DTYPES:
+        lab_codes, lab_uniques = pd.factorize(pd.Series(labels, dtype=object))
+        etiqueta = pd.Categorical.from_codes(lab_codes[codes], lab_uniques) if len(codes) else pd.Categorical([])
     else:
-        nom_df = pd.DataFrame(columns=["codigo_norm", "nombre", "alias"])
+        etiqueta = np.array(labels, dtype=object)[codes] if len(codes) else np.array([], dtype=object)
+    full = full.assign(Etiqueta=pd.Series(etiqueta, index=full.index))
+    full.attrs = dict(base.attrs)
+    return full
 
-    full["Codigo_norm"] = full["Código de la entidad"].apply(normalize_codigo_entidad)
-    full = full.merge(nom_df[["codigo_norm","nombre","alias"]], left_on="Codigo_norm", right_on="codigo_norm", how="left")
-    full["Etiqueta"] = full["nombre"]
-    if use_alias:
-        full["Etiqueta"] = np.where(full["alias"].notna() & (full["alias"].str.strip() != ""),
-                                    full["alias"], full["nombre"])
-    full["Etiqueta"] = full["Etiqueta"].fillna(full["Código de la entidad"])
+# ---------- Versión vigente y refresco en segundo plano ----------
+# Cada fuente tiene una versión vigente de la base por proceso. Un hilo revisa la fuente cada
+# REFRESH_INTERVAL_S (current.json del build, huellas de la carpeta local o listado de Drive) y,
+# si cambió, arma la versión nueva fuera del request y la publica con una sola asignación:
+# mientras tanto las sesiones siguen usando la anterior. Las capas derivadas se cachean por versión.
+# La carga inicial también corre en ese hilo y publica versiones parciales (el mes más reciente
+# primero) para que las páginas que aceptan datos parciales muestren algo antes de terminar.
+@dataclass(frozen=True, eq=False)
+class DatasetVersion:
+    base: pd.DataFrame      # solo identificadores; las métricas están en `store`
+    store: _ColumnStore
+    seps: tuple
+    version: str            # id del build precompilado o hash corto de la huella de la fuente
+    huella: str
+    actualizado: datetime   # cuándo se armó esta versión
+    progreso: tuple = None  # (archivos leídos, total) en una versión parcial; None = completa
+    derivados: set = field(default_factory=set, repr=False)  # entradas de caché armadas con esta versión
 
-    return full, used_seps, nomina_used, {"folder_id": folder_id, "files": files}
+def _per_version(cached):
+    """
+    Para funciones cacheadas cuyo último argumento es la DatasetVersion (`_dataset`, sin hashear):
+    registra cada llamada en esa versión para que _publish borre solo sus entradas al reemplazarla.
+    """
+    @functools.wraps(cached)
+    def call(*args):
+        args[-1].derivados.add((cached, args[:-1]))
+        return cached(*args)
+    call.clear = cached.clear
+    return call
 
-@st.cache_data(show_spinner=False)
-def load_all_data(data_dir: str, nomina_path_in: str = "Nomina.txt", include_aa=False, use_alias=True):
+class _Source:
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.current = None             # DatasetVersion vigente
+        self.lock = threading.Lock()    # una sola construcción a la vez por fuente
+        self.wake = threading.Event()   # request_refresh adelanta la próxima revisión
+        self.thread = None
+        self.refreshing = False
+        self.checked = None             # última revisión de la fuente
+        self.error = None               # error de la última revisión (se sigue sirviendo la versión vigente)
+        self.cond = threading.Condition()  # avisa cada publicación a los requests que esperan la carga inicial
+        self.failed = None              # excepción de la carga inicial (se relanza en esos requests)
+        self.stop = threading.Event()   # stop_refreshers: el hilo termina en su próxima vuelta
+
+_sources = OrderedDict()  # la usada más recientemente al final
+_sources_lock = threading.Lock()
+
+def _source(data_dir: str) -> _Source:
+    # como mucho REFRESH_MAX_SOURCES fuentes (LRU): cada carpeta escrita en la barra lateral crea una
+    key = _source_key(data_dir)
+    with _sources_lock:
+        src = _sources.get(key)
+        if src is None:
+            src = _sources[key] = _Source(data_dir)
+        _sources.move_to_end(key)
+        evicted = [_sources.pop(k) for k in list(_sources)[:-1]
+                   if len(_sources) > REFRESH_MAX_SOURCES and not _loading(_sources[k])]
+    for old in evicted:
+        _retire(old)
+    return src
+
+def _loading(src: _Source) -> bool:
+    # carga inicial pendiente o en curso (hay requests esperándola): la fuente no se descarta
+    return src.failed is None and (src.current is None or src.current.progreso is not None)
+
+def _retire(src: _Source):
+    # fuente descartada: su hilo termina en la próxima vuelta y se liberan las capas de su versión
+    src.stop.set()
+    src.wake.set()
+    if src.current is not None:
+        _release(src.current)
+
+def source_fingerprint(data_dir: str) -> str:
+    """Huella barata de la fuente: cambia con un build nuevo o con archivos nuevos, modificados o borrados."""
+    return _source_state(data_dir)[0]
+
+def _source_state(data_dir: str):
+    # (huella, listado de Drive o None): el refresco le pasa el listado a la carga para no repetirlo
+    _, manifest = _current_build()
+    if manifest is not None and manifest.get("source") == _source_key(data_dir):
+        return f"build:{manifest['build']}", None
+    folder_id = _drive_folder(data_dir)
+    files = None
+    if folder_id is not None:
+        files = _drive_list(folder_id)
+        entries = sorted((f["id"], f["name"], f.get("modifiedTime") or "") for f in files)
+    else:
+        p = Path(data_dir)
+        entries = sorted((f.name, _local_fingerprint(f)) for f in [*p.glob("*.csv"), *p.glob("*.txt")])
+    return hashlib.sha1(json.dumps(entries).encode("utf-8")).hexdigest(), files
+
+def _build_version(data_dir: str, huella: str, on_partial=None, files=None) -> DatasetVersion:
+    partial = None
+    if on_partial is not None:
+        def partial(full, done, total):
+            base, store = _ColumnStore.split(full)
+            # huella vacía: si la carga no termina, la próxima revisión la vuelve a intentar
+            on_partial(DatasetVersion(base, store, (), f"{huella[:8]}~{done}", "", datetime.now(), (done, total)))
+
+    with collect() as spans, span("base"):
+        prebuilt = _load_prebuilt(data_dir)
+        full, used_seps = (prebuilt if prebuilt is not None
+                           else _build_base(data_dir, lazy=True, on_partial=partial, files=files))
+    base, store = _ColumnStore.split(full)
+    if not base.empty:
+        base.attrs["tiempos"] = spans  # desglose de la carga que armó esta base
+    version = base.attrs["build"]["id"] if prebuilt is not None else huella[:8]
+    return DatasetVersion(base, store, tuple(used_seps), version, huella, datetime.now())
+
+def current_dataset(data_dir: str, partial: bool = False) -> DatasetVersion:
+    """
+    Versión vigente de la fuente; después de la primera carga la reemplaza el refresco en segundo
+    plano y las lecturas nunca esperan. La primera vez en el proceso espera la carga inicial (que
+    corre en el hilo de refresco): con partial=True alcanza con la primera versión parcial.
+    """
+    src = _source(data_dir)
+    ready = lambda: src.current is not None and (partial or src.current.progreso is None)
+    if ready():
+        return src.current
+    with src.cond:
+        if not ready():
+            src.failed = None
+            _start_refresher(src)
+            src.wake.set()
+            src.cond.wait_for(lambda: ready() or src.failed is not None)
+        if not ready():
+            raise src.failed
+        return src.current
+
+def _publish(src: _Source, version: DatasetVersion):
+    with src.cond:
+        old, src.current = src.current, version  # reemplazo atómico: cada sesión la toma en su próximo rerun
+        src.cond.notify_all()
+    # las capas derivadas de la versión reemplazada ya no se van a pedir; las de otras fuentes y
+    # versiones quedan (en la carga progresiva cada parcial libera solo lo suyo)
+    if old is not None:
+        _release(old)
+
+def _release(version: DatasetVersion):
+    for cached, args in list(version.derivados):
+        cached.clear(*args, None)
+    version.derivados.clear()
+
+def refresh_dataset(data_dir: str) -> bool:
+    """Revisa la fuente y, si cambió, arma la versión nueva y la publica. Devuelve True si la reemplazó."""
+    return _refresh(_source(data_dir))
+
+def _refresh(src: _Source) -> bool:
+    data_dir = src.data_dir
+    with src.lock:
+        # solo la carga inicial publica parciales: un refresco sigue sirviendo la versión completa anterior
+        initial = src.current is None or src.current.progreso is not None
+        try:
+            huella, files = _source_state(data_dir)
+            src.checked = datetime.now()
+            if src.current is not None and src.current.huella == huella:
+                src.error = None
+                return False
+            src.refreshing = True
+            with span("refresco", fuente=_source_key(data_dir)):
+                new = _build_version(data_dir, huella, (lambda v: _publish(src, v)) if initial else None, files)
+        except Exception as e:
+            src.error = f"{type(e).__name__}: {e}"
+            warnings.warn(f"No se pudo refrescar {data_dir}: {src.error}")
+            if initial:
+                with src.cond:
+                    src.failed = e
+                    src.cond.notify_all()
+            return False
+        finally:
+            src.refreshing = False
+        src.error = None
+        _publish(src, new)
+    return True
+
+def _refresh_loop(src: _Source):
+    while True:
+        src.wake.wait(REFRESH_INTERVAL_S or None)
+        src.wake.clear()
+        if src.stop.is_set():
+            return
+        _refresh(src)  # la fuente del hilo (aunque ya no esté en _sources), no una nueva
+
+def _start_refresher(src: _Source):
+    with _sources_lock:
+        if src.thread is not None:
+            return
+        src.thread = threading.Thread(target=_refresh_loop, args=(src,), daemon=True,
+                                      name=f"refresco-{_source_key(src.data_dir)}")
+    src.thread.start()
+
+def stop_refreshers(timeout: float = None):
+    """Detiene los hilos de refresco (espera la carga en curso) y olvida las fuentes y sus versiones."""
+    with _sources_lock:
+        sources = list(_sources.values())
+        _sources.clear()
+    for src in sources:
+        src.stop.set()
+        src.wake.set()
+    for src in sources:
+        if src.thread is not None:
+            src.thread.join(timeout)
+
+def request_refresh(data_dir: str):
+    """Adelanta la revisión de la fuente (no bloquea: el refresco corre en su hilo)."""
+    src = _source(data_dir)
+    _start_refresher(src)
+    src.wake.set()
+
+def dataset_status(data_dir: str) -> dict:
+    """Estado del refresco de la fuente: versión vigente, revisión, si está refrescando y último error."""
+    with _sources_lock:
+        src = _sources.get(_source_key(data_dir))  # consultar el estado no registra la fuente
+    cur = src.current if src else None
+    return {"version": cur.version if cur else None, "actualizado": cur.actualizado if cur else None,
+            "progreso": cur.progreso if cur else None,
+            "revisado": src.checked if src else None, "refrescando": bool(src and src.refreshing),
+            "error": src.error if src else None,
+            "metricas": len(cur.store.metrics) if cur else 0,
+            "metricas_en_memoria": len(cur.store.loaded()) if cur else 0,
+            "bytes_metricas": cur.store.nbytes() if cur else 0}
+
+# ---------- Tipos compactos ----------
+_CATEGORY_COLS = {"Fecha", "Código de la entidad", "Nombre de entidad", "__archivo", "Codigo_norm", "Etiqueta"}
+
+def _fits_float32(values: np.ndarray, decimals: int) -> bool:
+    # float32 tiene ~7 dígitos significativos: sirve para ratios, no para montos grandes
+    x = np.asarray(values, dtype="float64")
+    with np.errstate(over="ignore", invalid="ignore"):
+        x32 = x.astype("float32").astype("float64")
+    return np.array_equal(np.round(x32, decimals), np.round(x, decimals), equal_nan=True)
+
+def compact_frame(df: pd.DataFrame, decimals: int = COMPACT_DECIMALS) -> pd.DataFrame:
+    """Identificadores -> category y métricas -> float32 si no pierden precisión."""
+    out = {}
+    for c in df.columns:
+        s = df[c]
+        if c in _CATEGORY_COLS:
+            if not isinstance(s.dtype, pd.CategoricalDtype):
+                out[c] = s.astype("category")
+        elif s.dtype == "float64" and _fits_float32(s.to_numpy(), decimals):
+            out[c] = s.astype("float32")
+    return df.assign(**out) if out else df
+
+def as_float64(df: pd.DataFrame, decimals: int = COMPACT_DECIMALS) -> np.ndarray:
+    """Columnas numéricas como float64; las float32 se redondean a `decimals` y vuelven al valor leído."""
+    f32 = np.flatnonzero((df.dtypes == "float32").to_numpy())
+    values = df.to_numpy(dtype="float64", na_value=np.nan, copy=bool(len(f32)))
+    if len(f32):
+        values[:, f32] = np.round(values[:, f32], decimals)
+    return values
+
+def memory_report(df: pd.DataFrame) -> pd.DataFrame:
+    """Bytes en memoria por columna (incluye el contenido de strings/categorías), de mayor a menor."""
+    mem = df.memory_usage(deep=True, index=False)
+    return (pd.DataFrame({"columna": mem.index, "dtype": df.dtypes.astype(str).to_numpy(), "bytes": mem.to_numpy()})
+            .sort_values("bytes", ascending=False, kind="mergesort").reset_index(drop=True))
+
+# ---------- Dataset compartido por proceso ----------
+# Las páginas reciben vistas superficiales: con Copy-on-Write (siempre desde pandas 3; app.py lo
+# activa en pandas 2) modificarlas no toca el dataset compartido, y las métricas son arrays de
+# solo lectura, así que una escritura en el lugar falla en vez de alterarlo.
+
+def load_all_data(data_dir: str, nomina_path_in: str = "Nomina.txt", include_aa=False, use_alias=True,
+                  metrics=None, start=None, end=None, entities=None, partial=False):
     """
     data_dir:
       - Modo local: ruta a carpeta (ej. 'data')
@@ -231,104 +1234,633 @@ def load_all_data(data_dir: str, nomina_path_in: str = "Nomina.txt", include_aa=
     nomina_path_in:
       - local: nombre/ruta de Nomina.txt
       - drive: 'gdrive:<FILE_ID>' (opcional). Si no se da, se intenta auto-detectar en la carpeta.
-    """
-    # ---- Modo DRIVE ----
-    if isinstance(data_dir, str) and data_dir.lower().startswith("gdrive:"):
-        folder_id = data_dir.split(":",1)[1].strip()
-        df, seps, nomina_used, meta = _load_all_data_from_drive(folder_id, include_aa, use_alias)
-        # si se especificó nomina gdrive:<id>, forzamos esa
-        if df.empty:
-            return df, seps, nomina_used
-        if isinstance(nomina_path_in, str) and nomina_path_in.lower().startswith("gdrive:"):
-            try:
-                fid = nomina_path_in.split(":",1)[1].strip()
-                nbytes = drive_download_bytes(fid)
-                nom_df = _read_nomina_bytes(nbytes)
-                nom_df["codigo_norm"] = nom_df["codigo"].apply(normalize_codigo_entidad)
-                df = df.drop(columns=["nombre","alias","codigo_norm"], errors="ignore")\
-                       .merge(nom_df[["codigo_norm","nombre","alias"]],
-                              left_on="Codigo_norm", right_on="codigo_norm", how="left")
-                df["Etiqueta"] = np.where(df["alias"].notna() & (df["alias"].str.strip() != ""),
-                                          df["alias"], df["nombre"])
-                df["Etiqueta"] = df["Etiqueta"].fillna(df["Código de la entidad"])
-                nomina_used = f"drive:{fid}"
-            except Exception:
-                pass
-        return df, seps, nomina_used
+    El consolidado se persiste en SNAPSHOT_DIR: solo se re-leen los archivos nuevos o modificados.
+    En modo Drive se lee desde el espejo local (DRIVE_MIRROR_DIR), sincronizado por modifiedTime.
 
-    # ---- Modo LOCAL (como siempre) ----
-    p = Path(data_dir)
-    files = sorted(p.glob("*.csv"))
-    if not files:
-        return pd.DataFrame(), [], ""
+    El dataset se carga una sola vez por proceso y se comparte entre sesiones (sin deserializar
+    en cada rerun). La base (current_dataset) y la nómina se cachean aparte: include_aa y use_alias
+    solo recalculan una proyección liviana. Se devuelve una vista superficial: filtrar o asignar
+    columnas en la página copia solo lo que se toca y nunca altera el dataset compartido.
+    Los datos nuevos de la fuente los incorpora el refresco en segundo plano (REFRESH_INTERVAL_S);
+    df.attrs["version"] indica qué versión se está sirviendo.
 
-    dfs, used_seps = [], []
-    for f in files:
-        df, sep_used = try_read_csv_local(f)
-        if df is None:
-            continue
-        df.columns = [c.strip() for c in df.columns]
-        col_fecha = find_col(df.columns, "fecha") or "Fecha"
-        col_entidad = (find_col(df.columns, "código de la entidad")
-                       or find_col(df.columns, "codigo de la entidad")
-                       or find_col(df.columns, "entidad")
-                       or "Código de la entidad")
-        ren = {}
-        if col_fecha in df.columns: ren[col_fecha] = "Fecha"
-        if col_entidad in df.columns: ren[col_entidad] = "Código de la entidad"
-        if ren: df = df.rename(columns=ren)
-        if "Fecha" not in df.columns or "Código de la entidad" not in df.columns:
-            continue
-        df["__archivo"] = f.name
-        dfs.append(df)
-        used_seps.append(sep_used or ",")
+    Acceso proyectado (las páginas piden solo lo que usan):
+      metrics: métricas a incluir (None = todas; [] = solo identificadores y Etiqueta).
+        Cada métrica se lee del almacén columnar la primera vez que se pide; df.attrs["metricas"]
+        lista todas las disponibles (ver list_metrics).
+      start, end: rango de meses (inclusive); entities: etiquetas de entidad.
+    Se filtran primero las filas sobre los identificadores y después se agregan solo las
+    columnas pedidas, así que la copia por rerun escala con lo que la página usa.
 
-    if not dfs:
-        return pd.DataFrame(), [], ""
+    partial=True: en la primera carga del proceso no espera a que terminen todos los archivos;
+    devuelve los meses leídos hasta ahora (el más reciente primero) y
+    df.attrs["version"]["progreso"] = (leídos, total) hasta que la carga se completa.
+    """
+    ds = current_dataset(data_dir, partial)
+    df, seps, nomina_used = _load_all_data_shared(data_dir, nomina_path_in, include_aa, use_alias, ds.version, ds)
+    if not df.empty:
+        df = _select_rows(df, start, end, entities)
+        df = _with_metrics(df, ds, ds.store.metrics if metrics is None else metrics)
+    return df.copy(deep=False), list(seps), nomina_used
 
-    full = pd.concat(dfs, ignore_index=True)
-    full["Mes"] = full["Fecha"].apply(parse_fecha_value)
-    full = full.sort_values(["Mes", "Código de la entidad"], kind="mergesort").reset_index(drop=True)
+def _select_rows(df: pd.DataFrame, start=None, end=None, entities=None) -> pd.DataFrame:
+    mask = np.ones(len(df), dtype=bool)
+    if start is not None:
+        mask &= (df["Mes"] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (df["Mes"] <= pd.Timestamp(end)).to_numpy()
+    if entities:
+        mask &= df["Etiqueta"].isin(list(entities)).to_numpy()
+    return df if mask.all() else df[mask]
 
-    id_cols = {"Fecha", "Mes", "Código de la entidad", "__archivo", "Nombre de entidad"}
-    for c in [c for c in full.columns if c not in id_cols]:
-        full[c] = _to_num_series(full[c])
+def _with_metrics(df: pd.DataFrame, ds: DatasetVersion, metrics) -> pd.DataFrame:
+    """Agrega a la proyección (índice = fila de la base) las métricas pedidas que existan."""
+    known = set(ds.store.metrics)
+    names = [m for m in dict.fromkeys(metrics) if m in known and m not in df.columns]
+    if not names:
+        return df
+    pos = df.index.to_numpy()
+    whole = len(pos) == len(ds.base) and (pos == np.arange(len(pos))).all()
+    cols = {n: (v if whole else v[pos]) for n, v in ds.store.get(names).items()}
+    out = pd.concat([df, pd.DataFrame(cols, index=df.index, copy=False)], axis=1)
+    out.attrs = df.attrs
+    return out
 
-    if not include_aa:
-        full = full[~full["Código de la entidad"].astype(str).str.upper().str.startswith("AA")].copy()
-
-    full["Codigo_norm"] = full["Código de la entidad"].apply(normalize_codigo_entidad)
-    nomina_df, nomina_used = load_nomina_map([
-        nomina_path_in,
-        Path(data_dir) / nomina_path_in,
-        "Nomina.txt",
-        Path(data_dir) / "Nomina.txt",
-    ])
-    full = full.merge(nomina_df, left_on="Codigo_norm", right_on="codigo_norm", how="left")
-    full["Etiqueta"] = full["nombre"]
-    if use_alias:
-        full["Etiqueta"] = np.where(full["alias"].notna() & (full["alias"].str.strip() != ""),
-                                    full["alias"], full["nombre"])
-    full["Etiqueta"] = full["Etiqueta"].fillna(full["Código de la entidad"])
-
-    return full, used_seps, nomina_used
+@_per_version
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _load_all_data_shared(data_dir: str, nomina_path_in: str, include_aa: bool, use_alias: bool,
+                          version: str, _dataset: DatasetVersion):
+    # `version` es la clave de caché; `_dataset` (sin hashear) es la base de esa versión
+    base, seps = _dataset.base, list(_dataset.seps)
+    if base.empty:
+        return base, seps, ""
+    with collect() as spans:
+        with span("nomina"):
+            index, nomina_used = _load_nomina(data_dir, nomina_path_in, version)
+        with span("proyeccion"):
+            full = _project(base, index, include_aa, use_alias)
+    full.attrs["tiempos"] = base.attrs.get("tiempos", []) + spans
+    full.attrs["version"] = {"id": version, "actualizado": _dataset.actualizado.isoformat(timespec="seconds"),
+                             "progreso": _dataset.progreso}
+    full.attrs["metricas"] = list(_dataset.store.metrics)
+    return full, seps, nomina_used
 
 def list_numeric_columns(df: pd.DataFrame):
     id_cols = {"Fecha", "Mes", "Código de la entidad", "Etiqueta", "Codigo_norm",
                "__archivo", "nombre", "alias", "codigo_norm"}
     return [c for c in df.columns if c not in id_cols]
 
+def list_metrics(df: pd.DataFrame):
+    """Métricas del dataset, estén o no materializadas en df (más las columnas numéricas agregadas)."""
+    metricas = list(df.attrs.get("metricas", []))
+    known = set(metricas)
+    return metricas + [c for c in list_numeric_columns(df) if c not in known]
+
+# ---------- Cubo mes × entidad × métrica ----------
+@dataclass(frozen=True, eq=False)
+class DataCube:
+    """
+    Representación densa del dataset: values[mes, entidad, métrica] (NaN = sin dato).
+    El eje de meses es la serie mensual completa (los meses faltantes quedan en NaN), así que
+    un desplazamiento de k posiciones equivale a k meses calendario.
+    Los arrays son de solo lectura; sel() devuelve vistas cuando la selección es contigua.
+    """
+    values: np.ndarray
+    months: pd.DatetimeIndex
+    codes: np.ndarray
+    labels: np.ndarray
+    metrics: tuple
+    present: np.ndarray = None  # (mes, entidad): la entidad informó ese mes (aunque sea con NaN)
+    # (fuente, opciones, versión) de un cubo de load_cube: los cubos con el mismo origen comparten
+    # meses y entidades y sus métricas tienen los mismos valores, sea cual sea el conjunto pedido.
+    # None en cubos derivados (sel, normalized, transformed) o armados a mano.
+    origin: tuple = None
+
+    def __post_init__(self):
+        object.__setattr__(self, "_metric_idx", {m: i for i, m in enumerate(self.metrics)})
+        object.__setattr__(self, "_code_idx", {c: i for i, c in enumerate(self.codes)})
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def month_slice(self, start=None, end=None) -> slice:
+        i0 = 0 if start is None else self.months.searchsorted(pd.Timestamp(start), side="left")
+        i1 = len(self.months) if end is None else self.months.searchsorted(pd.Timestamp(end), side="right")
+        return slice(i0, i1)
+
+    def entity_index(self, labels=None, codes=None) -> np.ndarray:
+        if labels is None and codes is None:
+            return np.arange(len(self.codes))
+        if codes is not None:
+            return np.array([self._code_idx[c] for c in codes if c in self._code_idx], dtype=int)
+        return np.flatnonzero(np.isin(self.labels, list(labels)))
+
+    def metric_index(self, metrics) -> list:
+        return [self._metric_idx[m] for m in metrics]
+
+    def sel(self, start=None, end=None, labels=None, codes=None, metrics=None) -> "DataCube":
+        t = self.month_slice(start, end)
+        e = self.entity_index(labels, codes)
+        m = self.metric_index(metrics) if metrics is not None else slice(None)
+        values = self.values[t]
+        # un rango contiguo de entidades/métricas se resuelve como slice (vista, sin copia)
+        if len(e) and np.array_equal(e, np.arange(e[0], e[0] + len(e))):
+            values = values[:, e[0]:e[0] + len(e)]
+        else:
+            values = values[:, e]
+        values = values[:, :, m]
+        values.flags.writeable = False
+        present = self.present[t][:, e] if self.present is not None else None
+        return DataCube(values, self.months[t], self.codes[e], self.labels[e],
+                        tuple(np.asarray(self.metrics, dtype=object)[m]) if metrics is not None else self.metrics,
+                        present)
+
+    def normalized(self, mode: str) -> "DataCube":
+        """Normaliza cada serie (entidad × métrica) a lo largo de los meses, en una sola pasada."""
+        values = normalize_values(self.values, mode)
+        values.flags.writeable = False
+        return DataCube(values, self.months, self.codes, self.labels, self.metrics, self.present)
+
+    def transformed(self, transform: str) -> "DataCube":
+        """Aplica una transformación temporal (TRANSFORMS) a todas las series de una vez."""
+        values = transform_values(self.values, transform, self.months)
+        values.flags.writeable = False
+        return DataCube(values, self.months, self.codes, self.labels, self.metrics, self.present)
+
+    def lookup(self, df: pd.DataFrame, metric) -> np.ndarray:
+        """Valores de `metric` alineados con las filas de un DataFrame largo (por Mes y Codigo_norm)."""
+        t = self.months.get_indexer(df["Mes"])
+        e = pd.Index(self.codes).get_indexer(df["Codigo_norm"])
+        ok = (t >= 0) & (e >= 0)
+        out = np.full(len(df), np.nan)
+        out[ok] = self.values[t[ok], e[ok], self._metric_idx[metric]]
+        return out
+
+    def series(self, metric) -> pd.DataFrame:
+        """Matriz mes × entidad (columnas = etiquetas) para una métrica."""
+        return pd.DataFrame(self.values[:, :, self._metric_idx[metric]], index=self.months,
+                            columns=self.labels, copy=False)
+
+    def cross_section(self, month, metric) -> pd.Series:
+        """Valores de todas las entidades en un mes (índice = etiqueta), sin los NaN."""
+        t = self.months.get_loc(pd.Timestamp(month))
+        s = pd.Series(self.values[t, :, self._metric_idx[metric]], index=self.labels)
+        return s.dropna()
+
+    def to_long(self, value_name="Valor", dropna=True, by_entity=False) -> pd.DataFrame:
+        """
+        Formato largo [Mes, Codigo_norm, Etiqueta, Métrica, Valor].
+        dropna=False conserva las filas informadas con valor NaN (cortes en los gráficos).
+        by_entity=True ordena por Etiqueta, Métrica y Mes directamente desde el cubo (sin sort de filas).
+        """
+        if dropna or self.present is None:
+            keep = ~np.isnan(self.values)
+        else:
+            keep = np.broadcast_to(self.present[:, :, None], self.values.shape)
+        if by_entity:
+            lab = np.argsort(self.labels.astype(str), kind="stable")
+            e, m, t = np.nonzero(keep[:, lab, :].transpose(1, 2, 0))
+            e = lab[e]
+        else:
+            t, e, m = np.nonzero(keep)
+        return pd.DataFrame({
+            "Mes": self.months[t],
+            "Codigo_norm": self.codes[e],
+            "Etiqueta": self.labels[e],
+            "Métrica": np.asarray(self.metrics, dtype=object)[m],
+            value_name: self.values[t, e, m],
+        })
+
+def build_cube(df: pd.DataFrame, metrics=None) -> DataCube:
+    metrics = list(metrics) if metrics is not None else list_numeric_columns(df)
+    df = df[df["Mes"].notna()]
+    if df.empty:
+        return DataCube(np.empty((0, 0, len(metrics))), pd.DatetimeIndex([]),
+                        np.array([], dtype=object), np.array([], dtype=object), tuple(metrics),
+                        np.empty((0, 0), dtype=bool))
+    months = pd.date_range(df["Mes"].min(), df["Mes"].max(), freq="MS")
+    t = months.get_indexer(df["Mes"])
+    e, codes = pd.factorize(df["Codigo_norm"], sort=True)
+    labels = (pd.Series(df["Etiqueta"].to_numpy(dtype=object)).groupby(e).first()
+              .reindex(range(len(codes))).to_numpy(dtype=object))
+    values = np.full((len(months), len(codes), len(metrics)), np.nan)
+    values[t, e] = as_float64(df[metrics])  # duplicados: gana el último
+    values.flags.writeable = False
+    present = np.zeros((len(months), len(codes)), dtype=bool)
+    present[t, e] = True
+    return DataCube(values, months, np.asarray(codes, dtype=object), labels, tuple(metrics), present)
+
+def row_order(data_dir: str, nomina_path_in: str = "Nomina.txt", include_aa=False, use_alias=True,
+              by=("Etiqueta", "Mes"), partial=False) -> pd.Index:
+    """Índice del dataset compartido ordenado por `by` (estable); se ordena una vez por versión."""
+    ds = current_dataset(data_dir, partial)
+    return _row_order(data_dir, nomina_path_in, include_aa, use_alias, tuple(by), ds.version, ds)
+
+@_per_version
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _row_order(data_dir, nomina_path_in, include_aa, use_alias, by, version, _dataset):
+    df, _, _ = _load_all_data_shared(data_dir, nomina_path_in, include_aa, use_alias, version, _dataset)
+    if df.empty:
+        return df.index
+    # categorías por texto (el orden interno de una category no es alfabético)
+    as_text = lambda c: c.astype(str) if isinstance(c.dtype, pd.CategoricalDtype) else c
+    return df.sort_values(list(by), kind="mergesort", key=as_text).index
+
+def load_cube(data_dir: str, nomina_path_in: str = "Nomina.txt", include_aa=False, use_alias=True,
+              metrics=None, partial=False) -> DataCube:
+    """
+    Cubo del dataset compartido con `metrics` (None = todas); se construye una vez por versión,
+    combinación de opciones y conjunto de métricas.
+    """
+    ds = current_dataset(data_dir, partial)
+    metrics = ds.store.metrics if metrics is None else tuple(m for m in metrics if m in set(ds.store.metrics))
+    return _load_cube(data_dir, nomina_path_in, include_aa, use_alias, tuple(metrics), ds.version, ds)
+
+@_per_version
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _load_cube(data_dir, nomina_path_in, include_aa, use_alias, metrics, version, _dataset):
+    df, _, _ = _load_all_data_shared(data_dir, nomina_path_in, include_aa, use_alias, version, _dataset)
+    cube = build_cube(_with_metrics(df, _dataset, metrics), list(metrics))
+    return replace(cube, origin=(_source_key(data_dir), nomina_path_in, include_aa, use_alias, version))
+
+# ---------- Referencias: sistema y grupos de pares ----------
+# Estadísticos transversales por mes y métrica para todas las entidades (sin filas AA), cada grupo
+# de PEER_GROUPS y cada fila AA de la nómina (agregados del BCRA). Se calculan una vez por versión
+# y conjunto de métricas (el build los precalcula para todas) y se guardan en una tabla larga con
+# índice (Grupo, Métrica, Mes): las páginas solo la recorren para dibujar las bandas.
+BENCH_ALL = "Todas las entidades"
+BENCH_STATS = ["n", "p25", "mediana", "p75", "media_pond"]
+
+def benchmark_groups(cube: DataCube, peer_groups=None) -> dict:
+    """Grupo -> códigos: todas las entidades sin AA, los grupos de pares y cada fila AA (por su etiqueta)."""
+    peer_groups = PEER_GROUPS if peer_groups is None else peer_groups
+    aa = np.array([str(c).startswith("AA") for c in cube.codes], dtype=bool)
+    groups = {BENCH_ALL: list(cube.codes[~aa])}
+    for name, codes in peer_groups.items():
+        groups[name] = [normalize_codigo_entidad(c) for c in codes]
+    for code, label in zip(cube.codes[aa], cube.labels[aa]):
+        groups.setdefault(str(label), [code])
+    return groups
+
+def _nanquantiles(v: np.ndarray, qs) -> np.ndarray:
+    # cuantiles sobre el eje 1 ignorando NaN (interpolación lineal, como np.nanpercentile) sin
+    # recorrer serie por serie: se ordena una vez y se interpola entre posiciones
+    s = np.sort(v, axis=1)  # los NaN quedan al final
+    n = (~np.isnan(v)).sum(axis=1)
+    out = np.full((len(qs),) + n.shape, np.nan)
+    for k, q in enumerate(qs):
+        pos = np.maximum((n - 1) * q, 0)
+        lo, hi = np.floor(pos).astype(int), np.ceil(pos).astype(int)
+        a = np.take_along_axis(s, lo[:, None], axis=1)[:, 0]
+        b = np.take_along_axis(s, hi[:, None], axis=1)[:, 0]
+        out[k] = np.where(n > 0, a + (b - a) * (pos - lo), np.nan)
+    return out
+
+def _weight_metric(metrics):
+    return next((m for m in metrics if metric_code(m) == BENCHMARK_WEIGHT), None)
+
+def _empty_benchmarks() -> pd.DataFrame:
+    index = pd.MultiIndex.from_arrays([[], [], pd.DatetimeIndex([])], names=["Grupo", "Métrica", "Mes"])
+    return pd.DataFrame({c: [] for c in BENCH_STATS}, index=index)
+
+def compute_benchmarks(cube: DataCube, groups: dict, weight: str = None, metrics=None) -> pd.DataFrame:
+    """
+    Estadísticos de cada grupo (nombre -> códigos) por mes y métrica, en una pasada vectorizada por
+    grupo: entidades con dato (n), cuartiles, mediana y media ponderada por la métrica `weight`
+    del mismo mes y entidad (las entidades sin peso positivo no cuentan). Omite los meses sin datos.
+    """
+    metrics = list(cube.metrics if metrics is None else metrics)
+    m = cube.metric_index(metrics)
+    w_all = cube.values[:, :, cube.metric_index([weight])[0]] if weight in cube.metrics else None
+    frames = []
+    for name, codes in groups.items():
+        e = cube.entity_index(codes=codes)
+        if not len(e):
+            continue
+        v = cube.values[:, e][:, :, m]  # (meses, entidades, métricas)
+        valid = ~np.isnan(v)
+        q = _nanquantiles(v, (0.25, 0.5, 0.75))
+        if w_all is None:
+            wmean = np.full(q.shape[1:], np.nan)
+        else:
+            w = w_all[:, e, None]
+            w = np.where(valid & (np.nan_to_num(w) > 0), w, 0.0)
+            wsum = w.sum(axis=1)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                wmean = np.where(wsum > 0, (np.where(w > 0, v, 0.0) * w).sum(axis=1) / wsum, np.nan)
+        stats = (valid.sum(axis=1), q[0], q[1], q[2], wmean)
+        index = pd.MultiIndex.from_product([[name], metrics, cube.months], names=["Grupo", "Métrica", "Mes"])
+        # (meses, métricas) -> filas en orden métrica, mes
+        frames.append(pd.DataFrame({c: s.T.ravel() for c, s in zip(BENCH_STATS, stats)}, index=index))
+    if not frames:
+        return _empty_benchmarks()
+    out = pd.concat(frames)
+    out["n"] = out["n"].astype("int32")
+    return out[out["n"].to_numpy() > 0]
+
+def benchmark_series(bench: pd.DataFrame, group: str, metric: str, start=None, end=None) -> pd.DataFrame:
+    """Estadísticos de un grupo y una métrica indexados por Mes, en [start, end] (vacío si no hay)."""
+    try:
+        out = bench.xs((group, metric), level=["Grupo", "Métrica"])
+    except KeyError:
+        return bench.iloc[:0].droplevel(["Grupo", "Métrica"])
+    lo = None if start is None else pd.Timestamp(start)
+    hi = None if end is None else pd.Timestamp(end)
+    return out.loc[lo:hi]
+
+def load_benchmarks(data_dir: str, nomina_path_in: str = "Nomina.txt", metrics=None, partial=False) -> pd.DataFrame:
+    """
+    Referencias de `metrics` (None = todas): índice (Grupo, Métrica, Mes), columnas BENCH_STATS.
+    Se calculan una vez por versión y conjunto de métricas; con un build vigente se leen de lo
+    precalculado. No dependen de include_aa ni use_alias (las filas AA se nombran por la nómina).
+    """
+    ds = current_dataset(data_dir, partial)
+    known = set(ds.store.metrics)
+    metrics = ds.store.metrics if metrics is None else tuple(m for m in dict.fromkeys(metrics) if m in known)
+    return _load_benchmarks(data_dir, nomina_path_in, tuple(metrics), ds.version, ds)
+
+@_per_version
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _load_benchmarks(data_dir, nomina_path_in, metrics, version, _dataset):
+    if not metrics or _dataset.base.empty:
+        return _empty_benchmarks()
+    prebuilt = _load_prebuilt_benchmarks(data_dir, nomina_path_in, version, metrics)
+    if prebuilt is not None:
+        return prebuilt
+    with span("referencias", metricas=len(metrics)):
+        df, _, _ = _load_all_data_shared(data_dir, nomina_path_in, True, False, version, _dataset)
+        weight = _weight_metric(_dataset.store.metrics)
+        cols = list(dict.fromkeys(list(metrics) + ([weight] if weight else [])))
+        cube = build_cube(_with_metrics(df, _dataset, cols), cols)
+        return compute_benchmarks(cube, benchmark_groups(cube), weight, metrics)
+
+# ---------- Normalización ----------
+NORM_MODES = ["Raw", "Base 100 (primer mes)", "Min–Max (0–1)", "Z-score"]
+
+def _norm_mode(mode: str) -> str:
+    # acepta también la variante ASCII "Min-Max (0-1)"
+    return str(mode).replace("-", "–") if str(mode).startswith("Min") else mode
+
+def normalize_values(values: np.ndarray, mode: str) -> np.ndarray:
+    """
+    Normaliza a lo largo del eje 0 (meses) cada serie de un array (meses, ...), ignorando NaN.
+    Una serie sin base válida queda en NaN (Base 100) o en 0 (Min–Max, Z-score con rango/desvío nulo).
+    """
+    mode = _norm_mode(mode)
+    v = np.asarray(values, dtype="float64")
+    if mode not in NORM_MODES[1:] or v.shape[0] == 0:
+        return v.copy()
+    valid = ~np.isnan(v)
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # series sin datos (all-NaN)
+        if mode == "Base 100 (primer mes)":
+            first = np.take_along_axis(v, valid.argmax(axis=0)[None], axis=0)[0]
+            base = np.where(valid.any(axis=0) & (first != 0), first, np.nan)
+            return v / base * 100
+        if mode == "Min–Max (0–1)":
+            mn, mx = np.nanmin(v, axis=0), np.nanmax(v, axis=0)
+            ok = ~np.isnan(mn) & (mx != mn)
+            return np.where(ok, (v - mn) / np.where(ok, mx - mn, 1), v * 0)
+        # Z-score (desvío muestral, como pandas)
+        mu, sd = np.nanmean(v, axis=0), np.nanstd(v, axis=0, ddof=1)
+        ok = ~np.isnan(sd) & (sd != 0)
+        return np.where(ok, (v - mu) / np.where(ok, sd, 1), v * 0)
+
 def normalize_series(s: pd.Series, mode: str):
-    if mode == "Raw":
+    if _norm_mode(mode) not in NORM_MODES[1:]:
         return s
-    if mode == "Base 100 (primer mes)":
-        base = s.dropna()
-        base = base.iloc[0] if not base.empty else np.nan
-        return s / base * 100 if pd.notna(base) and base != 0 else s*np.nan
-    if mode == "Min–Max (0–1)":
-        mn, mx = s.min(skipna=True), s.max(skipna=True)
-        return (s - mn) / (mx - mn) if pd.notna(mn) and pd.notna(mx) and mx != mn else s*0
-    if mode == "Z-score":
-        mu, sd = s.mean(skipna=True), s.std(skipna=True)
-        return (s - mu) / sd if pd.notna(sd) and sd != 0 else s*0
-    return s
+    return pd.Series(normalize_values(s.to_numpy(dtype="float64", na_value=np.nan)[:, None], mode)[:, 0],
+                     index=s.index, name=s.name)
+
+def normalize_frame(df: pd.DataFrame, metrics, mode: str) -> pd.DataFrame:
+    """
+    Normaliza todas las entidades y métricas de un DataFrame largo en una sola pasada vectorizada.
+    Devuelve [Mes, Codigo_norm, Etiqueta, Métrica, Valor] (incluye las filas informadas con NaN),
+    ordenado por Etiqueta, Métrica y Mes.
+    """
+    return build_cube(df, metrics).normalized(mode).to_long(dropna=False, by_entity=True)
+
+# ---------- Transformaciones temporales ----------
+# Se calculan sobre el eje denso de meses del cubo (los meses sin dato quedan en NaN): "n meses
+# atrás" es siempre un desplazamiento de n posiciones, así que una variación nunca compara contra
+# el mes equivocado por un hueco en los datos. Todas las entidades y métricas en una pasada.
+TRANSFORMS = ["Nivel", "Var. % mensual", "Var. % interanual", "Dif. mensual", "Dif. interanual",
+              "Promedio móvil 3 meses", "Promedio móvil 12 meses", "Acumulado del año", "Real (deflactado)"]
+
+@st.cache_data(show_spinner=False)
+def load_deflator(path: str = None) -> pd.Series:
+    """Índice de precios por mes (DEFLATOR_PATH); vacío si no está configurado o no existe."""
+    path = DEFLATOR_PATH if path is None else path
+    if not path or not Path(path).exists():
+        return pd.Series(dtype="float64")
+    raw = pd.read_csv(path, sep=None, engine="python", dtype=str)
+    s = pd.Series(_to_num_series(raw.iloc[:, 1]).to_numpy(), index=pd.DatetimeIndex(parse_mes_series(raw.iloc[:, 0])))
+    s = s[s.index.notna() & (s > 0)]
+    return s.groupby(level=0).last()
+
+def transform_options() -> list:
+    """Transformaciones disponibles ("Real" solo con índice de precios)."""
+    return TRANSFORMS if not load_deflator().empty else TRANSFORMS[:-1]
+
+def _lag(v: np.ndarray, n: int) -> np.ndarray:
+    out = np.full_like(v, np.nan)
+    out[n:] = v[:-n]
+    return out
+
+def _span_sum(v: np.ndarray, start: np.ndarray) -> np.ndarray:
+    # suma de v[start[t]..t] para cada mes t con sumas acumuladas (sin ventanas por serie); NaN si
+    # falta algún mes de la ventana o si empieza antes del primer mes del cubo
+    shape = (1,) + v.shape[1:]
+    missing = np.isnan(v)
+    c = np.concatenate([np.zeros(shape), np.cumsum(np.where(missing, 0.0, v), axis=0)])
+    k = np.concatenate([np.zeros(shape, dtype=int), np.cumsum(missing, axis=0)])
+    t, s = np.arange(len(v)) + 1, np.maximum(start, 0)
+    bad = (k[t] - k[s] > 0) | (start < 0).reshape((-1,) + (1,) * (v.ndim - 1))
+    return np.where(bad, np.nan, c[t] - c[s])
+
+def transform_values(values: np.ndarray, transform: str, months: pd.DatetimeIndex) -> np.ndarray:
+    """
+    Transforma a lo largo del eje 0 cada serie de un array (meses, ...) cuyo eje de meses es
+    `months` (serie mensual completa, como en DataCube). Variaciones contra un mes sin dato o con
+    valor 0 quedan en NaN; el promedio móvil y el acumulado necesitan todos los meses de la ventana.
+    Real: valores a precios del último mes del índice (DEFLATOR_PATH).
+    """
+    v = np.asarray(values, dtype="float64")
+    if transform not in TRANSFORMS[1:] or v.shape[0] == 0:
+        return v.copy()
+    t = np.arange(len(v))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if transform in ("Var. % mensual", "Var. % interanual"):
+            prev = _lag(v, 1 if transform.endswith("mensual") else 12)
+            out = (v / np.where(prev != 0, prev, np.nan) - 1) * 100
+            return np.where(np.isfinite(out), out, np.nan)
+        if transform in ("Dif. mensual", "Dif. interanual"):
+            return v - _lag(v, 1 if transform.endswith("mensual") else 12)
+        if transform.startswith("Promedio móvil"):
+            n = int(transform.split()[2])
+            return _span_sum(v, t - n + 1) / n
+        if transform == "Acumulado del año":
+            return _span_sum(v, t - (months.month.to_numpy() - 1))
+    # Real
+    index = load_deflator()
+    if index.empty:
+        raise ValueError("No hay índice de precios para deflactar (DEFLATOR_PATH en config.py)")
+    factor = index.iloc[-1] / index.reindex(months).to_numpy(dtype="float64")
+    return v * factor.reshape((-1,) + (1,) * (v.ndim - 1))
+
+def load_transformed(data_dir: str, nomina_path_in: str = "Nomina.txt", include_aa=False, use_alias=True,
+                     metrics=None, transform: str = TRANSFORMS[0], partial=False) -> DataCube:
+    """
+    Cubo de `metrics` (None = todas) con la transformación aplicada. Cada (métrica, transformación)
+    se calcula una vez por versión y combinación de opciones, y la comparten todas las páginas.
+    """
+    ds = current_dataset(data_dir, partial)
+    known = set(ds.store.metrics)
+    metrics = ds.store.metrics if metrics is None else tuple(m for m in dict.fromkeys(metrics) if m in known)
+    if not metrics:
+        return _load_cube(data_dir, nomina_path_in, include_aa, use_alias, (), ds.version, ds)
+    cubes = [_load_transformed(data_dir, nomina_path_in, include_aa, use_alias, m, transform, ds.version, ds)
+             for m in metrics]
+    if len(cubes) == 1:
+        return cubes[0]
+    values = np.concatenate([c.values for c in cubes], axis=2)
+    values.flags.writeable = False
+    return DataCube(values, cubes[0].months, cubes[0].codes, cubes[0].labels, tuple(metrics), cubes[0].present)
+
+@_per_version
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _load_transformed(data_dir, nomina_path_in, include_aa, use_alias, metric, transform, version, _dataset):
+    cube = _load_cube(data_dir, nomina_path_in, include_aa, use_alias, (metric,), version, _dataset)
+    if transform not in TRANSFORMS[1:]:
+        return cube
+    with span("transformacion", metrica=metric, transformacion=transform):
+        return cube.transformed(transform)
+
+# ---------- Build offline (CLI) ----------
+# python -m lib_data build --source data/ --out snapshot/
+# Corre todo el pipeline sin Streamlit y escribe BUILD_DIR/<build>/ (base.parquet, nomina.parquet,
+# manifest.json); current.json apunta al último build y se reemplaza atómicamente.
+def _source_key(data_dir: str) -> str:
+    folder_id = _drive_folder(data_dir)
+    return f"gdrive:{folder_id}" if folder_id is not None else os.path.normpath(str(data_dir))
+
+def _current_build(build_dir=None):
+    """(carpeta, manifest) del build vigente, o (None, None)."""
+    root = Path(build_dir or BUILD_DIR)
+    try:
+        current = json.loads((root / "current.json").read_text(encoding="utf-8"))
+        bdir = root / current["build"]
+        manifest = json.loads((bdir / "manifest.json").read_text(encoding="utf-8"))
+    except Exception:
+        return None, None
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        return None, None
+    return bdir, manifest
+
+def _load_prebuilt(data_dir: str):
+    bdir, manifest = _current_build()
+    if manifest is None or manifest.get("source") != _source_key(data_dir):
+        return None
+    try:
+        # solo identificadores: las métricas se leen de base.parquet cuando se piden
+        with span("build_lectura", build=manifest["build"]):
+            full, store = _ColumnStore.open(bdir / "base.parquet")
+    except Exception:
+        return None
+    full.attrs = {"nan_coercidos": manifest.get("nan_coercidos", {}), "catalogo": manifest.get("catalogo", []),
+                  "build": {"id": manifest["build"], "creado": manifest.get("creado")}, "almacen": store}
+    return full, manifest.get("seps", [])
+
+def _load_prebuilt_nomina(data_dir: str, nomina_path_in: str):
+    bdir, manifest = _current_build()
+    if (manifest is None or manifest.get("source") != _source_key(data_dir)
+            or manifest.get("nomina_in") != nomina_path_in):
+        return None
+    try:
+        return pd.read_parquet(bdir / "nomina.parquet"), manifest.get("nomina", "")
+    except Exception:
+        return None
+
+def _benchmark_params() -> dict:
+    # las referencias precalculadas valen mientras no cambien los grupos ni la métrica de peso
+    return json.loads(json.dumps({"grupos": PEER_GROUPS, "peso": BENCHMARK_WEIGHT}))
+
+def _load_prebuilt_benchmarks(data_dir: str, nomina_path_in: str, version: str, metrics):
+    bdir, manifest = _current_build()
+    if (manifest is None or manifest["build"] != version or manifest.get("source") != _source_key(data_dir)
+            or manifest.get("nomina_in") != nomina_path_in or manifest.get("referencias") != _benchmark_params()):
+        return None
+    try:
+        bench = pd.read_parquet(bdir / "benchmarks.parquet", filters=[("Métrica", "in", list(metrics))])
+    except Exception:
+        return None
+    return bench.set_index(["Grupo", "Métrica", "Mes"])
+
+def build_snapshot(source: str, out: str = None, nomina_path_in: str = "Nomina.txt", keep: int = BUILD_KEEP) -> Path:
+    """Lee, normaliza y consolida `source` y publica un build nuevo en `out`. Devuelve su carpeta."""
+    root = Path(out or BUILD_DIR)
+    with collect() as spans:
+        with span("build_base"):
+            base, seps = _build_base(source)
+        if base.empty:
+            raise ValueError(f"No hay CSV para consolidar en {source}")
+        with span("build_nomina"):
+            nom_df, nomina_used = _read_nomina_source(source, nomina_path_in)
+        with span("build_referencias"):
+            metrics = [c for c in base.columns if c not in _KEY_COLS]
+            cube = build_cube(_project(base, nomina_index(nom_df), True, False), metrics)
+            bench = compute_benchmarks(cube, benchmark_groups(cube), _weight_metric(metrics))
+
+    # con microsegundos: dos builds en el mismo segundo no comparten carpeta (y el orden por nombre se mantiene)
+    build_id = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    tmp = root / f".{build_id}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    attrs, base.attrs = dict(base.attrs), {}
+    with span("build_escritura"):
+        base.to_parquet(tmp / "base.parquet", index=False)
+        nom_df[["codigo_norm", "nombre", "alias"]].to_parquet(tmp / "nomina.parquet", index=False)
+        bench.reset_index().to_parquet(tmp / "benchmarks.parquet", index=False)
+    manifest = {
+        "version": SNAPSHOT_VERSION, "build": build_id, "creado": datetime.now().isoformat(timespec="seconds"),
+        "source": _source_key(source), "nomina_in": nomina_path_in, "nomina": nomina_used,
+        "seps": seps, "filas": len(base), "archivos": int(base["__archivo"].nunique()),
+        "meses": [str(base["Mes"].min().date()), str(base["Mes"].max().date())],
+        "nan_coercidos": attrs.get("nan_coercidos", {}), "catalogo": attrs.get("catalogo", []),
+        "referencias": _benchmark_params(),
+        "tiempos": [{k: v for k, v in rec.items() if k != "t0"} for rec in spans],
+    }
+    (tmp / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=1, default=str), encoding="utf-8")
+    bdir = root / build_id
+    tmp.replace(bdir)
+    pointer = root / ".current.json.tmp"
+    pointer.write_text(json.dumps({"build": build_id}), encoding="utf-8")
+    pointer.replace(root / "current.json")
+
+    # se conservan los últimos `keep` builds
+    builds = sorted(p for p in root.iterdir() if p.is_dir() and not p.name.startswith("."))
+    for old in builds[:-keep] if keep else []:
+        shutil.rmtree(old, ignore_errors=True)
+    return bdir
+
+def main(argv=None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(prog="python -m lib_data", description="Herramientas de datos del tablero BCRA")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="consolida la fuente y publica un snapshot para la app")
+    b.add_argument("--source", required=True, help="carpeta con los CSV o gdrive:<FOLDER_ID>")
+    b.add_argument("--out", default=BUILD_DIR, help=f"carpeta de builds (default: {BUILD_DIR})")
+    b.add_argument("--nomina", default="Nomina.txt", help="nómina (ruta o gdrive:<FILE_ID>)")
+    b.add_argument("--keep", type=int, default=BUILD_KEEP, help="builds que se conservan")
+    args = ap.parse_args(argv)
+
+    bdir = build_snapshot(args.source, args.out, args.nomina, args.keep)
+    manifest = json.loads((bdir / "manifest.json").read_text(encoding="utf-8"))
+    print(f"Build {manifest['build']}: {manifest['archivos']} archivos, {manifest['filas']} filas, "
+          f"meses {manifest['meses'][0]} → {manifest['meses'][1]}, nómina: {manifest['nomina'] or 'no encontrada'}")
+    print(f"Publicado en {bdir}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
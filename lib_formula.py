@@ -0,0 +1,360 @@
+# lib_formula.py
+# Motor de fórmulas para indicadores derivados:
+#   (C_10002010 / C_10001000) * 100 - R1
+#   rolling_mean(R1, 3)      lag([C_10001000 - ACTIVO], 12)
+# Se parsea una vez, se compila a una función vectorizada sobre el cubo mes × entidad
+# y el resultado queda en una caché acotada compartida por todas las sesiones del proceso.
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from config import FORMULA_CACHE_SIZE
+from lib_data import DataCube, metric_code, transform_values, TRANSFORMS
+
+
+class FormulaError(ValueError):
+    pass
+
+
+# ---------- Referencias a métricas ----------
+def metric_ref(col: str) -> str:
+    """Referencia a usar dentro de una fórmula para una columna."""
+    return f"[{col}]"
+
+# ---------- Tokenizador / parser ----------
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<num>\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|\.\d+)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<col>\[[^\]]+\])
+  | (?P<op>[-+*/^(),])
+)""", re.VERBOSE)
+
+# nombre -> (mínimo, máximo) de argumentos; los argumentos de ventana deben ser constantes enteras
+FUNCTIONS = {
+    "lag": (1, 2),            # lag(x, n=1): valor de n meses atrás
+    "diff": (1, 2),           # diff(x, n=1): x - lag(x, n)
+    "pct": (1, 2),            # pct(x, n=1): variación % contra n meses atrás
+    "rolling_mean": (2, 2),   # rolling_mean(x, n): promedio móvil de n meses
+    "rolling_sum": (2, 2),    # rolling_sum(x, n): suma móvil de n meses
+    "abs": (1, 1),
+    "log": (1, 1),
+    "min": (2, 2),            # mínimo elemento a elemento
+    "max": (2, 2),
+}
+_WINDOW_FUNCS = {"lag", "diff", "pct", "rolling_mean", "rolling_sum"}
+
+def _tokenize(expr: str):
+    tokens, pos = [], 0
+    expr = expr.rstrip()
+    while pos < len(expr):
+        m = _TOKEN.match(expr, pos)
+        if not m or m.end() == pos:
+            raise FormulaError(f"Carácter inesperado en la posición {pos + 1}: {expr[pos:pos + 10]!r}")
+        kind = m.lastgroup
+        tokens.append((kind, m.group(kind)))
+        pos = m.end()
+    return tokens
+
+class _Parser:
+    # expr  := term (('+'|'-') term)*
+    # term  := unary (('*'|'/') unary)*
+    # unary := '-' unary | power
+    # power := atom ('^' unary)?
+    # atom  := num | col | name | name '(' args ')' | '(' expr ')'
+    def __init__(self, tokens, resolve):
+        self.tokens, self.i, self.resolve = tokens, 0, resolve
+
+    def peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else (None, None)
+
+    def take(self, value=None):
+        kind, val = self.peek()
+        if kind is None or (value is not None and val != value):
+            raise FormulaError(f"Se esperaba {value!r}" if value else "Fórmula incompleta")
+        self.i += 1
+        return kind, val
+
+    def parse(self):
+        node = self.expr()
+        if self.i != len(self.tokens):
+            raise FormulaError(f"Sobra texto a partir de {self.tokens[self.i][1]!r}")
+        return node
+
+    def expr(self):
+        node = self.term()
+        while self.peek()[1] in ("+", "-"):
+            op = self.take()[1]
+            node = ("bin", op, node, self.term())
+        return node
+
+    def term(self):
+        node = self.unary()
+        while self.peek()[1] in ("*", "/"):
+            op = self.take()[1]
+            node = ("bin", op, node, self.unary())
+        return node
+
+    def unary(self):
+        if self.peek()[1] == "-":
+            self.take()
+            return ("neg", self.unary())
+        if self.peek()[1] == "+":
+            self.take()
+            return self.unary()
+        return self.power()
+
+    def power(self):
+        node = self.atom()
+        if self.peek()[1] == "^":
+            self.take()
+            node = ("bin", "^", node, self.unary())
+        return node
+
+    def atom(self):
+        kind, val = self.take()
+        if kind == "num":
+            return ("num", float(val))
+        if kind == "col":
+            return ("var", self.resolve(val[1:-1].strip()))
+        if val == "(":
+            node = self.expr()
+            self.take(")")
+            return node
+        if kind == "name":
+            if self.peek()[1] == "(":
+                return self.call(val.lower())
+            return ("var", self.resolve(val))
+        raise FormulaError(f"Token inesperado: {val!r}")
+
+    def call(self, name):
+        if name not in FUNCTIONS:
+            raise FormulaError(f"Función desconocida: {name}()")
+        self.take("(")
+        args = []
+        if self.peek()[1] != ")":
+            args.append(self.expr())
+            while self.peek()[1] == ",":
+                self.take()
+                args.append(self.expr())
+        self.take(")")
+        lo, hi = FUNCTIONS[name]
+        if not lo <= len(args) <= hi:
+            raise FormulaError(f"{name}() recibe entre {lo} y {hi} argumentos")
+        if name in _WINDOW_FUNCS and len(args) == 2:
+            n = args[1]
+            if n[0] != "num" or n[1] != int(n[1]) or n[1] < 1:
+                raise FormulaError(f"{name}(): la ventana debe ser un entero positivo")
+        return ("call", name, tuple(args))
+
+def _resolver(metrics):
+    by_name = {m: m for m in metrics}
+    by_code = {}
+    for m in metrics:
+        by_code.setdefault(metric_code(m).upper(), []).append(m)
+
+    def resolve(ref):
+        if ref in by_name:
+            return ref
+        cands = by_code.get(metric_code(ref).upper(), [])
+        if len(cands) == 1:
+            return cands[0]
+        if cands:
+            raise FormulaError(f"'{ref}' es ambiguo; usá el nombre completo entre corchetes")
+        raise FormulaError(f"Métrica desconocida: {ref}")
+    return resolve
+
+def _fmt(node, codes=True) -> str:
+    """Texto normalizado (paréntesis explícitos); con codes=False se usan nombres completos."""
+    kind = node[0]
+    if kind == "num":
+        return f"{node[1]:g}"
+    if kind == "var":
+        return metric_code(node[1]) if codes else metric_ref(node[1])
+    if kind == "neg":
+        return f"-{_fmt(node[1], codes)}"
+    if kind == "bin":
+        return f"({_fmt(node[2], codes)} {node[1]} {_fmt(node[3], codes)})"
+    return f"{node[1]}({', '.join(_fmt(a, codes) for a in node[2])})"
+
+def _refs(node, out=None):
+    """Columnas referenciadas, en orden de aparición."""
+    out = [] if out is None else out
+    kind = node[0]
+    if kind == "var" and node[1] not in out:
+        out.append(node[1])
+    elif kind == "neg":
+        _refs(node[1], out)
+    elif kind == "bin":
+        _refs(node[2], out)
+        _refs(node[3], out)
+    elif kind == "call":
+        for arg in node[2]:
+            _refs(arg, out)
+    return out
+
+# ---------- Compilación a funciones vectorizadas (eje 0 = meses) ----------
+def _shift(x, n):
+    if np.ndim(x) == 0 or n == 0:
+        return x
+    out = np.full_like(x, np.nan)
+    out[n:] = x[:-n]
+    return out
+
+def _safe_div(a, b):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.divide(a, b)
+    return np.where(np.isfinite(out), out, np.nan)
+
+def _safe_pow(a, b):
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        out = np.power(a, b)
+    return np.where(np.isfinite(out), out, np.nan)
+
+def _safe_log(x):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(np.asarray(x) > 0, np.log(np.where(np.asarray(x) > 0, x, 1)), np.nan)
+
+def _diff(x, n):
+    return x - _shift(x, n)
+
+def _pct(x, n):
+    return (_safe_div(x, _shift(x, n)) - 1) * 100
+
+def _rolling(x, n, how):
+    if np.ndim(x) == 0:
+        return x
+    r = pd.DataFrame(x).rolling(n, min_periods=n)
+    return (r.mean() if how == "mean" else r.sum()).to_numpy()
+
+_BIN = {
+    "+": np.add,
+    "-": np.subtract,
+    "*": np.multiply,
+    "/": _safe_div,  # división segura: x/0 -> NaN
+    "^": _safe_pow,
+}
+
+_UNARY = {
+    "lag": _shift,
+    "diff": _diff,
+    "pct": _pct,
+    "rolling_mean": lambda x, n: _rolling(x, n, "mean"),
+    "rolling_sum": lambda x, n: _rolling(x, n, "sum"),
+    "abs": lambda x, n: np.abs(x),
+    "log": lambda x, n: _safe_log(x),
+}
+
+def _compile(node):
+    kind = node[0]
+    if kind == "num":
+        value = node[1]
+        return lambda env: value
+    if kind == "var":
+        col = node[1]
+        return lambda env: env[col]
+    if kind == "neg":
+        f = _compile(node[1])
+        return lambda env: -f(env)
+    if kind == "bin":
+        op, fa, fb = _BIN[node[1]], _compile(node[2]), _compile(node[3])
+        return lambda env: op(fa(env), fb(env))
+    name, args = node[1], node[2]
+    f = _compile(args[0])
+    if name in _UNARY:
+        fn, n = _UNARY[name], int(args[1][1]) if len(args) > 1 else 1
+        return lambda env: fn(f(env), n)
+    g, fn = _compile(args[1]), (np.fmin if name == "min" else np.fmax)
+    return lambda env: fn(f(env), g(env))
+
+
+class Formula:
+    """Fórmula parseada y compilada. key identifica la expresión normalizada (caché)."""
+
+    def __init__(self, expr: str, metrics):
+        ast = _Parser(_tokenize(expr), _resolver(metrics)).parse()
+        self.expr = expr
+        self.refs = _refs(ast)
+        self.label = _fmt(ast)[1:-1] if ast[0] == "bin" else _fmt(ast)
+        self.key = _fmt(ast, codes=False)
+        self._fn = _compile(ast)
+
+    def evaluate(self, cube: DataCube) -> np.ndarray:
+        """Evalúa sobre todo el cubo de una vez: devuelve un array (meses, entidades)."""
+        idx = dict(zip(self.refs, cube.metric_index(self.refs)))
+        env = {col: cube.values[:, :, i] for col, i in idx.items()}
+        out = np.asarray(self._fn(env), dtype="float64")
+        return np.broadcast_to(out, cube.values.shape[:2]).copy()
+
+@lru_cache(maxsize=256)
+def _compile_cached(expr: str, metrics: tuple) -> Formula:
+    return Formula(expr, metrics)
+
+def compile_formula(expr: str, metrics) -> Formula:
+    if not str(expr).strip():
+        raise FormulaError("La fórmula está vacía")
+    return _compile_cached(str(expr).strip(), tuple(metrics))
+
+def formula_metrics(exprs, metrics) -> list:
+    """Métricas que usan las fórmulas, en el orden de `metrics` (las fórmulas inválidas se ignoran)."""
+    refs = set()
+    for expr in exprs:
+        try:
+            refs.update(compile_formula(expr, metrics).refs)
+        except FormulaError:
+            continue
+    return [m for m in metrics if m in refs]
+
+# ---------- Caché de resultados (por proceso, acotada) ----------
+_results = OrderedDict()
+_results_lock = threading.Lock()
+
+def evaluate(cube: DataCube, expr: str, name: str = None, transform: str = None) -> DataCube:
+    """
+    Evalúa una fórmula sobre el cubo completo y devuelve un cubo de una sola métrica.
+    El resultado se cachea por (origen del cubo, expresión normalizada, transformación): el origen
+    es la versión del dataset y las opciones de carga (DataCube.origin), así que dos sesiones o
+    páginas que piden la misma fórmula no la recalculan aunque hayan pedido cubos con otras
+    métricas. Los cubos sin origen (derivados o armados a mano) se evalúan sin caché.
+    transform: transformación temporal del resultado (lib_data.TRANSFORMS; None = nivel).
+    """
+    formula = compile_formula(expr, cube.metrics)
+    transform = transform if transform in TRANSFORMS[1:] else None
+    key = None if cube.origin is None else (cube.origin, formula.key, transform)
+    values = None
+    if key is not None:
+        with _results_lock:
+            values = _results.get(key)
+            if values is not None:
+                _results.move_to_end(key)
+    if values is None:
+        if transform is None:
+            values = formula.evaluate(cube)
+        else:
+            values = transform_values(evaluate(cube, expr).values[:, :, 0], transform, cube.months)
+        values.flags.writeable = False
+        if key is not None:
+            with _results_lock:
+                _results[key] = values
+                while len(_results) > FORMULA_CACHE_SIZE:
+                    _results.popitem(last=False)
+    return DataCube(values[:, :, None], cube.months, cube.codes, cube.labels,
+                    (name or formula.label,), cube.present)
+
+def add_indicators(df: pd.DataFrame, cube: DataCube, indicators: dict, transform: str = None) -> pd.DataFrame:
+    """
+    Agrega al DataFrame largo una columna por indicador guardado ({nombre: fórmula}), con la
+    transformación temporal `transform` si se indica.
+    """
+    if not indicators or df.empty:
+        return df
+    cols = {}
+    for name, expr in indicators.items():
+        try:
+            cols[name] = evaluate(cube, expr, name, transform).lookup(df, name)
+        except FormulaError:
+            continue
+    return df.assign(**cols) if cols else df
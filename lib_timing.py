@@ -0,0 +1,114 @@
+# lib_timing.py
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+from config import TIMING_LOG_PATH, TIMING_BUFFER
+
+# ---------- Destinos: logger JSON, archivo opcional y buffer en memoria ----------
+logger = logging.getLogger("bcra.timing")
+if TIMING_LOG_PATH and not logger.handlers:
+    Path(TIMING_LOG_PATH).parent.mkdir(parents=True, exist_ok=True)
+    _handler = logging.FileHandler(TIMING_LOG_PATH, encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+_recent = deque(maxlen=TIMING_BUFFER)  # últimos tramos del proceso (todas las sesiones)
+_local = threading.local()             # colectores y profundidad del hilo actual
+
+def _stack() -> list:
+    if not hasattr(_local, "stack"):
+        _local.stack, _local.depth = [], 0
+    return _local.stack
+
+# ---------- Tramos ----------
+def record(stage: str, seconds: float, start: float = None, **fields) -> dict:
+    """Registra un tramo ya medido (ej. la suma de tiempos por archivo que devuelven los workers)."""
+    _stack()
+    rec = {"stage": stage, "ms": round(seconds * 1000, 3), "nivel": _local.depth,
+           "ts": datetime.now().isoformat(timespec="milliseconds"), **fields}
+    rec["t0"] = start if start is not None else time.perf_counter() - seconds
+    for spans in {id(spans): spans for spans in _local.stack}.values():
+        spans.append(rec)
+    _recent.append(rec)
+    logger.info(json.dumps({k: v for k, v in rec.items() if k != "t0"}, ensure_ascii=False, default=str))
+    return rec
+
+@contextmanager
+def span(stage: str, **fields):
+    """Mide el bloque y lo registra al salir (también si sale por excepción o st.stop)."""
+    _stack()
+    t0 = time.perf_counter()
+    _local.depth += 1
+    try:
+        yield
+    finally:
+        _local.depth -= 1
+        record(stage, time.perf_counter() - t0, start=t0, **fields)
+
+@contextmanager
+def _attach(spans: list):
+    stack = _stack()
+    stack.append(spans)
+    try:
+        yield spans
+    finally:
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i] is spans:
+                del stack[i]
+                break
+
+@contextmanager
+def collect():
+    """Junta en una lista los tramos que terminan dentro del bloque (en este hilo)."""
+    with _attach([]) as spans:
+        yield spans
+
+def recent() -> list:
+    """Últimos tramos registrados en el proceso, para exportar/agregar entre sesiones."""
+    return [{k: v for k, v in rec.items() if k != "t0"} for rec in list(_recent)]
+
+def timings_frame(spans) -> pd.DataFrame:
+    """Tramos en orden de inicio, con la etapa indentada según el anidamiento."""
+    if not spans:
+        return pd.DataFrame(columns=["etapa", "ms"])
+    df = pd.DataFrame(list(spans)).sort_values(["t0", "nivel"], kind="mergesort")
+    df["etapa"] = ["  " * int(n) + s for n, s in zip(df["nivel"], df["stage"])]
+    extra = [c for c in df.columns if c not in {"stage", "etapa", "ms", "nivel", "ts", "t0", "pagina", "sesion"}]
+    return df[["etapa", "ms", *extra]].reset_index(drop=True)
+
+# ---------- Tiempos por página ----------
+def _session_id():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id[:8] if ctx else None
+    except Exception:
+        return None
+
+class PageTimer:
+    """Tramos de una ejecución de página; quedan en st.session_state["tiempos"][página]."""
+    def __init__(self, page: str):
+        self.page = page
+        self.session = _session_id()
+        self.spans = []
+        st.session_state.setdefault("tiempos", {})[page] = self.spans
+
+    @contextmanager
+    def span(self, stage: str, **fields):
+        with _attach(self.spans), span(stage, pagina=self.page, sesion=self.session, **fields):
+            yield
+
+def export_json(groups: dict) -> str:
+    """{grupo: [tramos]} -> JSON para descargar/agregar entre sesiones."""
+    clean = {g: [{k: v for k, v in rec.items() if k != "t0"} for rec in spans] for g, spans in groups.items()}
+    return json.dumps(clean, ensure_ascii=False, indent=1, default=str)
@@ -0,0 +1,203 @@
+# lib_ui.py
+import hashlib
+import time
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import streamlit as st
+
+from lib_data import as_float64, dataset_status
+from config import (CHART_WEBGL_POINTS, CHART_DOWNSAMPLE, CHART_MAX_POINTS, TABLE_PAGE_SIZES, TABLE_PAGE_SIZE,
+                    STREAM_RERUN_S)
+
+# ---------- Downsampling LTTB ----------
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: índices de n_out puntos que preservan la forma de la serie
+    (siempre incluye el primero y el último). x e y sin NaN y x ordenado.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1], dtype=int)[:max(n_out, 0)]
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)  # n_out-2 baldes entre el primero y el último
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # promedio del balde siguiente (o el último punto) como tercer vértice
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+def _trace_keep(xv: np.ndarray, yv: np.ndarray, idx: np.ndarray, n_out: int) -> np.ndarray:
+    # idx: filas de una serie ordenadas por x. Se reducen los puntos con valor; de cada tramo
+    # de NaN se conserva la primera fila para que el gráfico siga mostrando el hueco. Los huecos
+    # cuentan dentro de n_out (si son más de la mitad, se conserva una parte pareja de ellos).
+    y = yv[idx]
+    finite = np.isfinite(y)
+    gaps = idx[~finite & np.r_[True, finite[:-1]]]
+    if len(gaps) > n_out // 2:
+        gaps = gaps[np.linspace(0, len(gaps) - 1, n_out // 2).astype(int)]
+    pts = idx[finite]
+    budget = n_out - len(gaps)
+    if len(pts) > budget:
+        pts = pts[lttb_indices(xv[pts], yv[pts], budget)]
+    return np.concatenate([pts, gaps])
+
+def _budgets(sizes: np.ndarray, max_points: int) -> np.ndarray:
+    # reparte max_points entre las series: las cortas van enteras y el resto se divide en partes iguales
+    out = np.empty(len(sizes), dtype=int)
+    left = max_points
+    for k, i in enumerate(np.argsort(sizes, kind="stable")):
+        out[i] = min(sizes[i], left // (len(sizes) - k))
+        left -= out[i]
+    return out
+
+def downsample(df: pd.DataFrame, x: str, y: str, by, max_points: int = CHART_MAX_POINTS) -> pd.DataFrame:
+    """
+    Reduce cada serie (grupo `by`) con LTTB para que el total no supere max_points; respeta el orden
+    original. Con muchas series cada una puede quedar con pocos puntos (siempre el primero y el último).
+    """
+    if len(df) <= max_points:
+        return df
+    by = [c for c in ([by] if isinstance(by, str) else by) if c]
+    groups = list((df.groupby(by, sort=False, observed=True).indices if by else {None: np.arange(len(df))}).values())
+    budgets = _budgets(np.array([len(idx) for idx in groups]), max_points)
+    xv = df[x].to_numpy(dtype="datetime64[ns]").astype("int64") if np.issubdtype(df[x].dtype, np.datetime64) \
+        else df[x].to_numpy(dtype="float64")
+    yv = df[y].to_numpy(dtype="float64", na_value=np.nan)
+    keep = []
+    for idx, n_out in zip(groups, budgets):
+        idx = idx[np.argsort(xv[idx], kind="mergesort")]
+        keep.append(idx if len(idx) <= n_out else _trace_keep(xv, yv, idx, n_out))
+    return df.iloc[np.sort(np.concatenate(keep))]
+
+# ---------- Gráficos de líneas ----------
+def line_chart(df: pd.DataFrame, x: str, y: str, color: str = None, line_dash: str = None,
+               downsample_points: bool = CHART_DOWNSAMPLE, **kwargs):
+    """
+    px.line para muchas entidades/métricas: por encima de CHART_WEBGL_POINTS usa trazas WebGL y,
+    si downsample_points, reduce las series largas con LTTB (los puntos que quedan son valores
+    reales, así que el hover sigue mostrando datos exactos). Devuelve (fig, puntos_enviados, puntos_totales).
+    """
+    total = len(df)
+    if downsample_points:
+        df = downsample(df, x, y, [color, line_dash])
+    fig = px.line(df, x=x, y=y, color=color, line_dash=line_dash,
+                  render_mode="webgl" if len(df) > CHART_WEBGL_POINTS else "svg", **kwargs)
+    # hover con el valor completo (sin abreviar a k/M/B), hasta 4 decimales
+    fig.update_yaxes(hoverformat=",.4~f")
+    return fig, len(df), total
+
+def add_benchmark_band(fig, band: pd.DataFrame, name: str):
+    """
+    Superpone la referencia de un grupo (lib_data.benchmark_series): banda p25–p75, mediana y media
+    ponderada por activo. Un grupo de una sola entidad (filas AA) se dibuja como una línea.
+    """
+    if band.empty:
+        return fig
+    x = band.index
+    line = lambda y, label, dash, **kw: go.Scatter(x=x, y=band[y], name=f"{name}: {label}", legendgroup=name,
+                                                   mode="lines", line=dict(color="rgba(90,90,90,0.9)", dash=dash), **kw)
+    if (band["n"] <= 1).all():
+        fig.add_trace(line("mediana", "valor", "dot"))
+        return fig
+    fig.add_trace(go.Scatter(x=x, y=band["p75"], mode="lines", line=dict(width=0), legendgroup=name,
+                             showlegend=False, hoverinfo="skip"))
+    fig.add_trace(go.Scatter(x=x, y=band["p25"], mode="lines", line=dict(width=0), legendgroup=name,
+                             fill="tonexty", fillcolor="rgba(128,128,128,0.2)", name=f"{name}: p25–p75",
+                             customdata=band["p75"], hovertemplate="%{y:,.4~f} – %{customdata:,.4~f}"))
+    fig.add_trace(line("mediana", "mediana", "dash"))
+    fig.add_trace(line("media_pond", "media ponderada por activo", "dot"))
+    return fig
+
+def downsample_note(sent: int, total: int) -> str:
+    return f"Mostrando {sent:,} de {total:,} puntos (LTTB por serie); los valores del hover son exactos." \
+        if sent < total else ""
+
+# ---------- Tabla paginada ----------
+def _search_mask(df: pd.DataFrame, text: str) -> np.ndarray:
+    # búsqueda sin distinguir mayúsculas en columnas de texto/categoría y en meses (YYYY-MM);
+    # se compara contra los valores distintos y se propaga a las filas
+    mask = np.zeros(len(df), dtype=bool)
+    for c in df.columns:
+        s = df[c]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            hit = s.cat.categories.astype(str).str.contains(text, case=False, regex=False, na=False)
+            mask |= np.isin(s.cat.codes.to_numpy(), np.flatnonzero(hit))
+        elif np.issubdtype(s.dtype, np.datetime64):
+            codes, uniques = pd.factorize(s)
+            hit = pd.Index(uniques.strftime("%Y-%m")).str.contains(text, regex=False, na=False)
+            mask |= np.isin(codes, np.flatnonzero(hit))
+        elif s.dtype == object or pd.api.types.is_string_dtype(s.dtype):
+            codes, uniques = pd.factorize(s)
+            hit = pd.Index(uniques.astype(str)).str.contains(text, case=False, regex=False, na=False)
+            mask |= np.isin(codes, np.flatnonzero(hit))
+    return mask
+
+def paged_table(df: pd.DataFrame, key: str, order: pd.Index = None, columns=None, height: int = 380):
+    """
+    Tabla paginada del lado del servidor: búsqueda, selección de columnas y página.
+    order: índice de filas ya ordenado (ej. lib_data.row_order), puede incluir filas que no están en df;
+      sin order se muestran en el orden de df. Solo se materializa y envía la página visible.
+    """
+    pos = np.arange(len(df)) if order is None else df.index.get_indexer(order)
+    pos = pos[pos >= 0]
+
+    c1, c2, c3 = st.columns([3, 1, 1])
+    with c1:
+        text = st.text_input("Buscar", key=f"{key}_buscar", placeholder="Entidad, código o mes (YYYY-MM)")
+    if text.strip():
+        pos = pos[_search_mask(df, text.strip())[pos]]
+    with c2:
+        size = st.selectbox("Filas", TABLE_PAGE_SIZES, key=f"{key}_filas",
+                            index=TABLE_PAGE_SIZES.index(TABLE_PAGE_SIZE))
+    pages = max(1, -(-len(pos) // size))
+    if st.session_state.get(f"{key}_pagina", 1) > pages:
+        st.session_state[f"{key}_pagina"] = 1
+    with c3:
+        page = st.number_input(f"Página (de {pages})", min_value=1, max_value=pages, step=1, key=f"{key}_pagina")
+
+    all_cols = list(df.columns)
+    # la clave depende de las columnas disponibles: si cambian (otra métrica) vuelven las de `columns`
+    cols_key = hashlib.md5("\x1f".join(map(str, all_cols)).encode("utf-8")).hexdigest()[:8]
+    cols = st.multiselect("Columnas", all_cols, key=f"{key}_columnas_{cols_key}",
+                          default=[c for c in (columns or all_cols) if c in all_cols])
+    start = (int(page) - 1) * size
+    view = df.iloc[pos[start:start + size]][cols or all_cols]
+    f32 = [c for c in view.columns if view[c].dtype == "float32"]
+    if f32:
+        view = view.assign(**dict(zip(f32, as_float64(view[f32]).T)))
+    st.dataframe(view, use_container_width=True, hide_index=True, height=height)
+    st.caption(f"Filas {min(start + 1, len(pos))}–{min(start + size, len(pos))} de {len(pos):,}"
+               + (f" (filtradas de {len(df):,})" if len(pos) < len(df) else ""))
+
+# ---------- Carga progresiva ----------
+def loading_progress(df: pd.DataFrame) -> bool:
+    """Barra de progreso si df es una versión parcial (primera carga en curso). Devuelve True si lo es."""
+    progreso = df.attrs.get("version", {}).get("progreso")
+    if not progreso:
+        return False
+    done, total = progreso
+    st.progress(done / total if total else 0.0,
+                text=f"Cargando datos: {done} de {total} archivos (se muestran primero los meses más recientes)")
+    return True
+
+def rerun_while_loading(df: pd.DataFrame, data_dir: str, seconds: float = STREAM_RERUN_S):
+    """Al final de la página: con datos parciales, vuelve a ejecutarla para sumar los meses que ya llegaron."""
+    version = df.attrs.get("version", {})
+    if not version.get("progreso"):
+        return
+    status = dataset_status(data_dir)
+    if status["refrescando"] or status["version"] != version.get("id"):
+        time.sleep(seconds)
+        st.rerun()
@@ -1,126 +1,173 @@
-import streamlit as st
-import plotly.express as px
-import pandas as pd
-import unicodedata
-
-from config import DEFAULT_DATA_DIR
-from lib_data import load_all_data, list_numeric_columns
-
-st.title("📈 Series temporales")
-
-# ---------- Estado compartido (mismos defaults en toda la app) ----------
-if "data_dir" not in st.session_state:
-    st.session_state["data_dir"] = DEFAULT_DATA_DIR
-if "nomina_path_in" not in st.session_state:
-    st.session_state["nomina_path_in"] = "Nomina.txt"
-if "include_aa" not in st.session_state:
-    st.session_state["include_aa"] = True
-if "use_alias" not in st.session_state:
-    st.session_state["use_alias"] = False
-
-# ---------- Sidebar ----------
-with st.sidebar:
-    st.header("Datos")
-    st.text_input("Carpeta de datos (.csv)", key="data_dir")
-    st.text_input("Archivo nómina", key="nomina_path_in")
-    st.checkbox("Incluir 'AA...'", key="include_aa")
-    st.checkbox("Usar alias", key="use_alias")
-
-# ---------- Helpers para defaults ----------
-def _norm_txt(s: str) -> str:
-    if s is None:
-        return ""
-    s = str(s)
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    return s.lower()
-
-def pick_default_entity(entities):
-    cand = None
-    for e in entities:
-        se = _norm_txt(e)
-        if "nacion" in se:
-            return e
-        if se.strip() in {"bna", "banco nacion", "banco de la nacion argentina"}:
-            cand = cand or e
-    for code in ["0011", "00011", "11"]:
-        for e in entities:
-            if e.strip().lstrip("0") == code.lstrip("0"):
-                return e
-    return cand or (entities[0] if entities else None)
-
-def pick_default_metric(num_cols):
-    for c in num_cols:
-        if _norm_txt(c).startswith("r1"):
-            return c
-    for c in num_cols:
-        if "roe" in _norm_txt(c):
-            return c
-    for c in num_cols:
-        if "rendimiento anual del patrimonio" in _norm_txt(c):
-            return c
-    return num_cols[0] if num_cols else None
-
-# ---------- Carga de datos ----------
-df, seps, _ = load_all_data(
-    st.session_state["data_dir"],
-    st.session_state["nomina_path_in"],
-    st.session_state["include_aa"],
-    st.session_state["use_alias"],
-)
-if df.empty:
-    st.info("Cargá CSV en la carpeta indicada o usá gdrive:<FOLDER_ID>.")
-    st.stop()
-
-df["Mes"] = pd.to_datetime(df["Mes"], errors="coerce")
-valid = df["Mes"].dropna()
-if valid.empty:
-    st.error("No hay columna 'Mes' válida en los datos.")
-    st.stop()
-
-min_mes, max_mes = valid.min().to_pydatetime(), valid.max().to_pydatetime()
-rango = st.slider("Rango de meses", min_value=min_mes, max_value=max_mes, value=(min_mes, max_mes), format="YYYY-MM")
-df = df[(df["Mes"] >= pd.Timestamp(rango[0])) & (df["Mes"] <= pd.Timestamp(rango[1]))]
-
-# ---------- Filtros ----------
-entidades = sorted(df["Etiqueta"].dropna().unique())
-default_ent = pick_default_entity(entidades)
-sel_ent = st.multiselect("Entidades (opcional)", entidades, default=[default_ent] if default_ent else [])
-if sel_ent:
-    df = df[df["Etiqueta"].isin(sel_ent)]
-
-num_cols = list_numeric_columns(df)
-if not num_cols:
-    st.error("No hay columnas numéricas para graficar.")
-    st.stop()
-
-default_metric = pick_default_metric(num_cols)
-metric_idx = num_cols.index(default_metric) if default_metric in num_cols else 0
-metric = st.selectbox("Indicador", num_cols, index=metric_idx)
-
-# ---------- Gráfico serie ----------
-st.subheader("Serie temporal")
-fig = px.line(df, x="Mes", y=metric, color="Etiqueta",
-              labels={"Mes": "Mes", metric: metric, "Etiqueta": "Entidad"},
-              title=f"Evolución de {metric}")
-fig.update_layout(height=460, legend_title_text="Entidad")
-st.plotly_chart(fig, use_container_width=True)
-
-# ---------- Top-N ----------
-st.subheader("Top-N por mes")
-meses = sorted(df["Mes"].dropna().unique())
-mes_sel = st.selectbox("Mes", [m.to_pydatetime() for m in meses],
-                       index=len(meses)-1, format_func=lambda d: d.strftime("%Y-%m"))
-df_mes = df[df["Mes"] == pd.Timestamp(mes_sel)].copy()
-topn = st.slider("Top N", 5, 50, 15)
-df_mes = df_mes.sort_values(metric, ascending=False).head(topn)
-fig2 = px.bar(df_mes, x=metric, y="Etiqueta", orientation="h",
-              labels={"Etiqueta": "Entidad", metric: metric},
-              title=f"Top {topn} en {pd.Timestamp(mes_sel).strftime('%Y-%m')} – {metric}")
-fig2.update_layout(height=600, yaxis={'categoryorder': 'total ascending'})
-st.plotly_chart(fig2, use_container_width=True)
-
-# ---------- Tabla ----------
-st.subheader("Tabla")
-st.dataframe(df.sort_values(["Etiqueta","Mes"]).reset_index(drop=True),
-             use_container_width=True, height=380)
+import streamlit as st
+import plotly.express as px
+import pandas as pd
+import unicodedata
+
+from config import DEFAULT_DATA_DIR
+from lib_data import (load_all_data, load_cube, row_order, list_metrics, load_benchmarks, benchmark_series,
+                      load_transformed, transform_options, TRANSFORMS)
+from lib_formula import add_indicators, evaluate, formula_metrics
+from lib_timing import PageTimer
+from lib_ui import (line_chart, downsample_note, paged_table, loading_progress, rerun_while_loading,
+                    add_benchmark_band)
+
+st.title("📈 Series temporales")
+timer = PageTimer("Series")
+
+# ---------- Estado compartido (mismos defaults en toda la app) ----------
+if "data_dir" not in st.session_state:
+    st.session_state["data_dir"] = DEFAULT_DATA_DIR
+if "nomina_path_in" not in st.session_state:
+    st.session_state["nomina_path_in"] = "Nomina.txt"
+if "include_aa" not in st.session_state:
+    st.session_state["include_aa"] = True
+if "use_alias" not in st.session_state:
+    st.session_state["use_alias"] = False
+
+# ---------- Sidebar ----------
+with st.sidebar:
+    st.header("Datos")
+    st.text_input("Carpeta de datos (.csv)", key="data_dir")
+    st.text_input("Archivo nómina", key="nomina_path_in")
+    st.checkbox("Incluir 'AA...'", key="include_aa")
+    st.checkbox("Usar alias", key="use_alias")
+
+# ---------- Helpers para defaults ----------
+def _norm_txt(s: str) -> str:
+    if s is None:
+        return ""
+    s = str(s)
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return s.lower()
+
+def pick_default_entity(entities):
+    cand = None
+    for e in entities:
+        se = _norm_txt(e)
+        if "nacion" in se:
+            return e
+        if se.strip() in {"bna", "banco nacion", "banco de la nacion argentina"}:
+            cand = cand or e
+    for code in ["0011", "00011", "11"]:
+        for e in entities:
+            if e.strip().lstrip("0") == code.lstrip("0"):
+                return e
+    return cand or (entities[0] if entities else None)
+
+def pick_default_metric(num_cols):
+    for c in num_cols:
+        if _norm_txt(c).startswith("r1"):
+            return c
+    for c in num_cols:
+        if "roe" in _norm_txt(c):
+            return c
+    for c in num_cols:
+        if "rendimiento anual del patrimonio" in _norm_txt(c):
+            return c
+    return num_cols[0] if num_cols else None
+
+# ---------- Carga de datos ----------
+# primero solo identificadores (meses y entidades); la métrica elegida se pide más abajo
+opciones = (st.session_state["data_dir"], st.session_state["nomina_path_in"],
+            st.session_state["include_aa"], st.session_state["use_alias"])
+with timer.span("carga"):
+    df, seps, _ = load_all_data(*opciones, metrics=[], partial=True)
+    if df.empty:
+        st.info("Cargá CSV en la carpeta indicada o usá gdrive:<FOLDER_ID>.")
+        st.stop()
+
+    # indicadores guardados en la Calculadora (cacheados por fórmula)
+    indicadores = st.session_state.get("indicadores", {})
+
+# primera carga en curso: se grafica con los meses ya leídos y la página se actualiza sola
+loading_progress(df)
+
+valid = df["Mes"].dropna()
+if valid.empty:
+    st.error("No hay columna 'Mes' válida en los datos.")
+    st.stop()
+
+min_mes, max_mes = valid.min().to_pydatetime(), valid.max().to_pydatetime()
+rango = st.slider("Rango de meses", min_value=min_mes, max_value=max_mes, value=(min_mes, max_mes), format="YYYY-MM")
+df = df[(df["Mes"] >= pd.Timestamp(rango[0])) & (df["Mes"] <= pd.Timestamp(rango[1]))]
+
+# ---------- Filtros ----------
+entidades = sorted(df["Etiqueta"].dropna().unique())
+default_ent = pick_default_entity(entidades)
+sel_ent = st.multiselect("Entidades (opcional)", entidades, default=[default_ent] if default_ent else [])
+
+metricas = list_metrics(df)
+num_cols = metricas + [n for n in indicadores if n not in metricas]
+if not num_cols:
+    st.error("No hay columnas numéricas para graficar.")
+    st.stop()
+
+default_metric = pick_default_metric(num_cols)
+metric_idx = num_cols.index(default_metric) if default_metric in num_cols else 0
+metric = st.selectbox("Indicador", num_cols, index=metric_idx)
+transform = st.selectbox("Transformación", transform_options(), index=0,
+                         help="Variaciones y ventanas por mes calendario: un mes sin dato no se compara contra otro")
+
+# solo la métrica elegida (o las que usa el indicador), en el rango y las entidades elegidas
+with timer.span("columnas", metrica=metric, transformacion=transform):
+    df = load_all_data(*opciones, metrics=[metric], start=rango[0], end=rango[1], entities=sel_ent or None,
+                       partial=True)[0]
+    # serie de la métrica ya transformada, calculada una vez por (métrica, transformación) y versión
+    if metric in indicadores:
+        base_cube = load_cube(*opciones, metrics=formula_metrics([indicadores[metric]], metricas), partial=True)
+        serie_cube = evaluate(base_cube, indicadores[metric], metric, transform)
+        df = add_indicators(df, base_cube, {metric: indicadores[metric]}, transform)
+    else:
+        serie_cube = load_transformed(*opciones, metrics=[metric], transform=transform, partial=True)
+        if transform != TRANSFORMS[0]:
+            df = df.assign(**{metric: serie_cube.lookup(df, metric)})
+    # referencias (sistema, grupos de pares y filas AA) precalculadas por versión; no hay para indicadores
+    bench = load_benchmarks(opciones[0], opciones[1], metrics=[metric], partial=True)
+
+grupos = list(bench.index.unique("Grupo"))
+referencia = st.selectbox("Referencia", ["(ninguna)"] + grupos, disabled=not grupos or transform != TRANSFORMS[0],
+                          help="Banda p25–p75, mediana y media ponderada por activo del grupo en cada mes "
+                               "(sin transformación)")
+titulo = metric if transform == TRANSFORMS[0] else f"{metric} – {transform}"
+
+# ---------- Gráfico serie ----------
+st.subheader("Serie temporal")
+with timer.span("grafico_serie"):
+    fig, enviados, total = line_chart(df, "Mes", metric, color="Etiqueta",
+                                      labels={"Mes": "Mes", metric: metric, "Etiqueta": "Entidad"},
+                                      title=f"Evolución de {titulo}")
+    if referencia in grupos and transform == TRANSFORMS[0]:
+        add_benchmark_band(fig, benchmark_series(bench, referencia, metric, *rango), referencia)
+    fig.update_layout(height=460, legend_title_text="Entidad")
+    st.plotly_chart(fig, use_container_width=True)
+    if enviados < total:
+        st.caption(downsample_note(enviados, total))
+
+# ---------- Top-N ----------
+st.subheader("Top-N por mes")
+meses = sorted(df["Mes"].dropna().unique())
+mes_sel = st.selectbox("Mes", [m.to_pydatetime() for m in meses],
+                       index=len(meses)-1, format_func=lambda d: d.strftime("%Y-%m"))
+topn = st.slider("Top N", 5, 50, 15)
+# corte transversal directo sobre el cubo (sin filtrar el DataFrame largo)
+with timer.span("topn"):
+    cube = serie_cube.sel(labels=sel_ent or None, metrics=[metric])
+    df_mes = (cube.cross_section(mes_sel, metric).nlargest(topn)
+              .rename(metric).rename_axis("Etiqueta").reset_index())
+with timer.span("grafico_topn"):
+    fig2 = px.bar(df_mes, x=metric, y="Etiqueta", orientation="h",
+                  labels={"Etiqueta": "Entidad", metric: metric},
+                  title=f"Top {topn} en {pd.Timestamp(mes_sel).strftime('%Y-%m')} – {titulo}")
+    fig2.update_layout(height=600, yaxis={'categoryorder': 'total ascending'})
+    st.plotly_chart(fig2, use_container_width=True)
+
+# ---------- Tabla ----------
+st.subheader("Tabla")
+with timer.span("tabla"):
+    # orden (Etiqueta, Mes) precalculado sobre el dataset compartido; solo viaja la página visible
+    orden = row_order(*opciones, partial=True)
+    paged_table(df, "series_tabla", order=orden,
+                columns=["Etiqueta", "Código de la entidad", "Mes", metric])
+
+rerun_while_loading(df, st.session_state["data_dir"])
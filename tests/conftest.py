@@ -0,0 +1,30 @@
+# tests/conftest.py
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import lib_data  # noqa: E402
+
+DATA_DIR = ROOT / "data"
+
+
+@pytest.fixture
+def cache_dirs(tmp_path, monkeypatch):
+    """Snapshots, espejo de Drive y builds en carpetas temporales; ingesta en serie (orden determinista)."""
+    monkeypatch.setattr(lib_data, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    monkeypatch.setattr(lib_data, "DRIVE_MIRROR_DIR", str(tmp_path / "drive"))
+    monkeypatch.setattr(lib_data, "BUILD_DIR", str(tmp_path / "builds"))
+    monkeypatch.setattr(lib_data, "INGEST_MODE", "serial")
+    yield tmp_path
+    lib_data.stop_refreshers(timeout=30)
+
+
+@pytest.fixture
+def data_copy(tmp_path):
+    """Copia de data/ (los CSV reales del repo) que el test puede modificar."""
+    return Path(shutil.copytree(DATA_DIR, tmp_path / "data"))
@@ -0,0 +1,12 @@
+# tests/test_bench.py
+import lib_data
+from bench.run import run
+
+
+def test_run_keeps_workdir_contents(tmp_path):
+    (tmp_path / "importante.txt").write_text("no borrar")
+    snapshot_dir = lib_data.SNAPSHOT_DIR
+    result = run(months=2, entities=5, metrics=3, repeat=1, workdir=str(tmp_path))
+    assert result["stages"]
+    assert [p.name for p in tmp_path.iterdir()] == ["importante.txt"]
+    assert lib_data.SNAPSHOT_DIR == snapshot_dir
@@ -0,0 +1,46 @@
+# tests/test_carga_progresiva.py
+import pandas as pd
+
+import lib_data
+from conftest import DATA_DIR
+
+# data/ mezcla nombres con año ('resultado Mayo 24.csv') y sin año ('resultado Abril.csv' = 2025-04)
+NEWEST_FIRST = [
+    "resultado Abril.csv", "resultado Marzo.csv", "resultado Febrero.csv", "resultado Enero.csv",
+    "resultado Diciembre.csv", "resultado noviembre 24.csv", "resultado octubre 24.csv",
+    "resultado septiembre 24.csv", "resultado agosto 24.csv", "resultado Julio 24.csv",
+    "resultado junio 24.csv", "resultado Mayo 24.csv",
+]
+
+
+def test_sniff_month_reads_fecha_column():
+    assert lib_data.sniff_month(DATA_DIR / "resultado Abril.csv") == pd.Timestamp(2025, 4, 1)
+    assert lib_data.sniff_month(DATA_DIR / "Nomina.txt") is pd.NaT
+
+
+def test_recent_first_local_names_without_year():
+    files = {f.name: f for f in DATA_DIR.glob("*.csv")}
+    order = lib_data._recent_first(sorted(files), when=lambda name: lib_data.sniff_month(files[name]))
+    assert order == NEWEST_FIRST
+
+
+def test_recent_first_drive_falls_back_to_modified_time():
+    files = [
+        {"name": "resultado Diciembre.csv", "modifiedTime": "2025-01-10T12:00:00.000Z"},
+        {"name": "resultado noviembre 24.csv", "modifiedTime": "2025-06-01T12:00:00.000Z"},
+        {"name": "resultado Abril.csv", "modifiedTime": "2025-05-08T09:30:00.000Z"},
+        {"name": "resultado Enero.csv"},
+    ]
+    order = lib_data._recent_first(files, name=lambda f: f["name"], when=lib_data._drive_month)
+    assert [f["name"] for f in order] == ["resultado Abril.csv", "resultado Diciembre.csv",
+                                          "resultado noviembre 24.csv", "resultado Enero.csv"]
+
+
+def test_first_partial_is_latest_month(cache_dirs, data_copy, monkeypatch):
+    monkeypatch.setattr(lib_data, "STREAM_PUBLISH_S", 0)
+    partials = []
+    full, _ = lib_data._build_base(str(data_copy), on_partial=lambda df, done, total: partials.append(
+        (sorted(df["Mes"].unique()), done, total)))
+    assert partials[0] == ([pd.Timestamp(2025, 4, 1)], 1, 12)
+    assert partials[1][0] == [pd.Timestamp(2025, 3, 1), pd.Timestamp(2025, 4, 1)]
+    assert full["Mes"].nunique() == 12
@@ -0,0 +1,56 @@
+# tests/test_catalogo.py
+import numpy as np
+import pandas as pd
+
+import lib_data
+from lib_data import parse_metric_header, build_metric_catalog, metric_code
+
+# data/: L1 y L9 cambiaron de encabezado (mayo-julio 2024 vs. el resto); el más reciente es el canónico
+L1_NEW = "L1 - Liq con tit c/cotiz+posición de CALL, LELIQ y LEFIs(%)"
+L1_OLD = "L1 - Liq con titulos c/cotiz + posición de call y leliq (%)"
+L9_NEW = "L9 - LIQUIDEZ CON LELIQ, PASES y LEFI (%):"
+L9_OLD = "L9 - Liquidez con leliq y pases (%)"
+
+
+def test_parse_metric_header():
+    assert parse_metric_header("C_10001000 - ACTIVO") == ("C_10001000", "ACTIVO", None)
+    assert parse_metric_header(L9_NEW) == ("L9", "LIQUIDEZ CON LELIQ, PASES y LEFI", "%")
+    assert parse_metric_header(L1_NEW) == ("L1", "Liq con tit c/cotiz+posición de CALL, LELIQ y LEFIs", "%")
+    assert parse_metric_header("R8 - Cobertura (en veces)")[2] == "en veces"
+    assert metric_code("rg2_ii - Margen") == "RG2_II"
+
+
+def test_catalog_prefers_newest_header_and_order():
+    files = [
+        {"mes": "2024-05", "columnas": [L1_OLD, "C_1 - A", L9_OLD, "X9 - Sale"]},
+        {"mes": "2025-04", "columnas": ["C_1 - A", L9_NEW, L1_NEW]},
+    ]
+    catalog = build_metric_catalog(files)
+    assert [r["columna"] for r in catalog] == ["C_1 - A", L9_NEW, L1_NEW, "X9 - Sale"]
+    l9 = next(r for r in catalog if r["codigo"] == "L9")
+    assert l9["variantes"] == [L9_NEW, L9_OLD] and l9["desde"] == "2024-05" and l9["hasta"] == "2025-04"
+
+
+def test_drifting_headers_are_one_column(cache_dirs, data_copy):
+    full, _ = lib_data._build_base(str(data_copy))
+    codes = [metric_code(c) for c in full.columns if c not in lib_data._KEY_COLS]
+    assert len(codes) == len(set(codes))
+    assert L1_NEW in full.columns and L9_NEW in full.columns
+    assert L1_OLD not in full.columns and L9_OLD not in full.columns
+    # los meses con el encabezado viejo quedan en la columna canónica (sin huecos por el cambio)
+    for col in (L1_NEW, L9_NEW):
+        informed = full.groupby("Mes", observed=True)[col].count()
+        assert (informed > 0).all() and len(informed) == 12
+
+    catalog = lib_data.metric_catalog(full).set_index("codigo")
+    assert set(catalog.loc["L9", "variantes"]) == {L9_NEW, L9_OLD}
+    assert catalog.loc["L1", "desde"] == "2024-05" and catalog.loc["L1", "hasta"] == "2025-04"
+
+
+def test_conform_maps_old_header_values():
+    catalog = build_metric_catalog([{"mes": "2025-04", "columnas": [L9_NEW, "C_1 - A"]}])
+    old = pd.DataFrame({"Mes": [pd.Timestamp(2024, 5, 1)], "Código de la entidad": ["00007"],
+                        L9_OLD: [41.5]})
+    out = lib_data._conform(old, catalog)
+    assert list(out.columns) == ["Mes", "Código de la entidad", L9_NEW, "C_1 - A"]
+    assert out[L9_NEW].iloc[0] == 41.5 and np.isnan(out["C_1 - A"].iloc[0])
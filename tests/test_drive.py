@@ -0,0 +1,77 @@
+# tests/test_drive.py
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import lib_data
+from conftest import DATA_DIR
+
+FOLDER = "gdrive:carpeta"
+
+
+@pytest.fixture
+def drive(cache_dirs, monkeypatch):
+    """Carpeta de Drive simulada con los archivos de data/: cuenta listados y registra cada descarga."""
+    files = [{"id": f"id-{p.name}", "name": p.name, "modifiedTime": "2025-05-03T12:00:00.000Z"}
+             for p in sorted(DATA_DIR.iterdir())]
+    log = {"listados": 0, "descargas": [], "lecturas": [], "files": files}
+    lock = threading.Lock()
+
+    def fake_list(folder_id):
+        log["listados"] += 1
+        return [dict(f) for f in log["files"]]
+
+    def fake_download(file_id, service=None):
+        time.sleep(0.1)
+        with lock:
+            log["descargas"].append((file_id, time.perf_counter()))
+        return (DATA_DIR / file_id[3:]).read_bytes()
+
+    ingest = lib_data._ingest_file
+
+    def spy_ingest(path):
+        log["lecturas"].append(time.perf_counter())
+        return ingest(path)
+
+    monkeypatch.setattr(lib_data, "_drive_list", fake_list)
+    monkeypatch.setattr(lib_data, "_drive_build", lambda: None)
+    monkeypatch.setattr(lib_data, "drive_download_bytes", fake_download)
+    monkeypatch.setattr(lib_data, "_ingest_file", spy_ingest)
+    monkeypatch.setattr(lib_data, "DRIVE_MAX_WORKERS", 4)
+    return log
+
+
+def test_parsing_overlaps_downloads(drive):
+    full, _ = lib_data._build_base(FOLDER)
+    assert full["Mes"].nunique() == 12 and len(drive["descargas"]) == 13
+    # el primer CSV se parsea mientras todavía hay descargas en curso
+    assert min(drive["lecturas"]) < max(t for _, t in drive["descargas"])
+    assert drive["listados"] == 1
+
+
+def test_one_listing_per_revision(drive):
+    assert lib_data.refresh_dataset(FOLDER)  # carga inicial progresiva (por lotes)
+    assert drive["listados"] == 1
+    assert lib_data.current_dataset(FOLDER).base["Mes"].max() == pd.Timestamp(2025, 4, 1)
+    assert len(drive["descargas"]) == 13
+
+    assert not lib_data.refresh_dataset(FOLDER)  # sin cambios en Drive
+    assert drive["listados"] == 2
+
+    lib_data.stop_refreshers()  # reinicio en caliente: espejo y snapshot al día
+    assert lib_data.refresh_dataset(FOLDER)
+    assert drive["listados"] == 3 and len(drive["descargas"]) == 13
+
+
+def test_deleted_and_modified_files(drive, cache_dirs):
+    lib_data._build_base(FOLDER)
+    drive["files"] = [f for f in drive["files"] if f["name"] != "resultado Abril.csv"]
+    drive["files"][0]["modifiedTime"] = "2025-06-01T00:00:00.000Z"  # Nomina.txt
+    drive["descargas"].clear()
+    full, _ = lib_data._build_base(FOLDER)
+    assert full["Mes"].max() == pd.Timestamp(2025, 3, 1)
+    assert [fid for fid, _ in drive["descargas"]] == ["id-Nomina.txt"]
+    mirror = cache_dirs / "drive" / "carpeta"
+    assert not (mirror / "resultado Abril.csv").exists() and (mirror / "Nomina.txt").exists()
@@ -0,0 +1,38 @@
+# tests/test_formulas.py
+import numpy as np
+
+import lib_data
+import lib_formula
+from lib_formula import evaluate
+
+RATIO = "(C_10002010 / C_10001000) * 100"
+
+
+def test_evaluate_shared_across_cubes_with_other_metrics(cache_dirs, data_copy):
+    src = str(data_copy)
+    lib_formula._results.clear()
+    metricas = lib_data.current_dataset(src).store.metrics
+    activo, depositos = (next(m for m in metricas if m.startswith(c)) for c in ("C_10001000", "C_10002010"))
+    # cada página arma su cubo con otras métricas u otro orden (refs, formula_metrics, unión)
+    cubes = [lib_data.load_cube(src, metrics=[depositos, activo]),
+             lib_data.load_cube(src, metrics=[activo, depositos]),
+             lib_data.load_cube(src)]
+    results = [evaluate(c, RATIO) for c in cubes]
+    assert len(lib_formula._results) == 1
+    assert all(np.shares_memory(r.values, results[0].values) for r in results)
+
+    cube = cubes[2]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        expected = cube.series(depositos).to_numpy() / cube.series(activo).to_numpy() * 100
+    np.testing.assert_allclose(results[0].values[:, :, 0], expected)
+
+    evaluate(cubes[0], RATIO, transform="Var. % mensual")
+    evaluate(cubes[1], RATIO, transform="Var. % mensual")
+    assert len(lib_formula._results) == 2
+
+
+def test_evaluate_without_origin_is_not_cached(cache_dirs, data_copy):
+    cube = lib_data.load_cube(str(data_copy))
+    lib_formula._results.clear()
+    out = evaluate(cube.sel(start="2025-01-01"), RATIO)
+    assert out.shape[0] == 4 and not lib_formula._results
@@ -0,0 +1,49 @@
+# tests/test_graficos.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib_ui import downsample, lttb_indices
+
+
+def _long_frame(metrics, entities, months, gaps=False):
+    rng = np.random.default_rng(0)
+    mes = pd.date_range("2015-01-01", periods=months, freq="MS")
+    idx = pd.MultiIndex.from_product([[f"M{i}" for i in range(metrics)], [f"E{i:03d}" for i in range(entities)], mes],
+                                     names=["Métrica", "Etiqueta", "Mes"])
+    valor = rng.normal(size=len(idx)).cumsum()
+    if gaps:
+        valor[rng.random(len(idx)) < 0.2] = np.nan
+    return pd.DataFrame({"Valor": valor}, index=idx).reset_index()
+
+
+@pytest.mark.parametrize("metrics, entities, months, gaps", [
+    (6, 88, 120, False),   # Comparador: 6 métricas × 88 entidades = 528 series, 63.360 puntos
+    (6, 88, 120, True),
+    (1, 5000, 12, False),  # más series que puntos por serie en el tope
+    (1, 3, 30000, True),
+])
+def test_downsample_respects_max_points(metrics, entities, months, gaps):
+    df = _long_frame(metrics, entities, months, gaps)
+    out = downsample(df, "Mes", "Valor", ["Etiqueta", "Métrica"], max_points=20000)
+    assert len(out) <= 20000
+    assert out.index.is_monotonic_increasing
+    # todas las series siguen presentes, con su primer y último mes
+    ends = df.groupby(["Etiqueta", "Métrica"])["Mes"].agg(["min", "max"])
+    kept = out.groupby(["Etiqueta", "Métrica"])["Mes"].agg(["min", "max"])
+    assert len(kept) == len(ends)
+    if not gaps:
+        pd.testing.assert_frame_equal(kept, ends)
+
+
+def test_downsample_gives_short_series_their_points():
+    df = pd.concat([_long_frame(1, 1, 10).assign(Etiqueta="corta"), _long_frame(1, 2, 5000)], ignore_index=True)
+    out = downsample(df, "Mes", "Valor", "Etiqueta", max_points=1000)
+    counts = out["Etiqueta"].value_counts()
+    assert counts["corta"] == 10 and counts.sum() == 1000
+
+
+def test_lttb_small_budget():
+    x = np.arange(100.0)
+    assert list(lttb_indices(x, x, 2)) == [0, 99]
+    assert len(lttb_indices(x, x, 1)) == 1 and len(lttb_indices(x, x, 0)) == 0
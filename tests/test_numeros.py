@@ -0,0 +1,59 @@
+# tests/test_numeros.py
+import numpy as np
+import pandas as pd
+import pytest
+
+import lib_data
+from conftest import DATA_DIR
+from lib_data import detect_num_convention, _to_num_series, _prepare_frame
+
+
+@pytest.mark.parametrize("values, expected", [
+    (["29,43", "3,5", "-0,12"], (",", ".")),
+    (["1.234,50", "12,00"], (",", ".")),
+    (["1,234.50", "0.75"], (".", ",")),
+    (["1.234.567"], (",", ".")),
+    (["1,234,567"], (".", ",")),
+    (["1.234"], (".", ",")),             # ambiguo: no vota
+    (["3.02", "1.234"], (".", ",")),
+    (["12,5", "1.234"], (",", ".")),
+])
+def test_detect_num_convention(values, expected):
+    assert detect_num_convention(values) == expected
+
+
+@pytest.mark.parametrize("values, expected", [
+    (["29,43", "3,5"], [29.43, 3.5]),     # la versión original daba 2943 y 35
+    (["1.234,50", "-2,25"], [1234.5, -2.25]),
+    (["1,234.50", "0.75"], [1234.5, 0.75]),
+    (["12,5 %", " 1.000,0"], [12.5, 1000.0]),
+    (["3.75", "-2.81"], [3.75, -2.81]),
+])
+def test_to_num_series(values, expected):
+    np.testing.assert_allclose(_to_num_series(pd.Series(values)).to_numpy(), expected)
+
+
+def test_prepare_frame_uses_one_convention_per_file_and_counts_coercions():
+    df = pd.DataFrame({
+        "Fecha": ["202401", "202401", "202401"],
+        "Código de la entidad": ["7", "11", "AA000"],
+        "R1 - Rendimiento (%)": ["29,43", "1.234", "n/d"],
+        "C_10001000 - ACTIVO": ["1.234,50", "", None],
+    }, dtype="str")
+    out = _prepare_frame(df, "resultado Enero 24.csv")
+    np.testing.assert_allclose(out["R1 - Rendimiento (%)"], [29.43, 1234.0, np.nan])
+    np.testing.assert_allclose(out["C_10001000 - ACTIVO"], [1234.5, np.nan, np.nan])
+    assert out.attrs["nan_coercidos"] == {"R1 - Rendimiento (%)": 1}
+    assert (out["Mes"] == pd.Timestamp(2024, 1, 1)).all()
+
+
+def test_repo_file_matches_plain_float_parse():
+    # data/ usa punto decimal sin separador de miles ('24634800332.00', '3.75')
+    path = DATA_DIR / "resultado Abril.csv"
+    df, _ = lib_data._ingest_file(str(path))
+    raw = pd.read_csv(path, dtype={"código de la entidad": str})
+    raw.columns = [" ".join(c.split()) for c in raw.columns]
+    metrics = [c for c in df.columns if c not in lib_data._ID_COLS]
+    assert len(metrics) > 30
+    for c in metrics:
+        np.testing.assert_allclose(df[c].to_numpy(), pd.to_numeric(raw[" ".join(c.split())], errors="coerce"))
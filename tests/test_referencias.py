@@ -0,0 +1,69 @@
+# tests/test_referencias.py
+import numpy as np
+import pandas as pd
+import pytest
+
+import lib_data
+from lib_data import build_cube, compute_benchmarks, benchmark_groups, benchmark_series, BENCH_ALL
+
+
+@pytest.fixture
+def long_df():
+    rng = np.random.default_rng(7)
+    months = pd.date_range("2023-01-01", periods=8, freq="MS")
+    codes = [f"{i:05d}" for i in range(1, 31)] + ["AA000"]
+    df = pd.DataFrame([(m, c) for m in months for c in codes], columns=["Mes", "Codigo_norm"])
+    df["Etiqueta"] = df["Codigo_norm"].map(lambda c: "Sistema" if c == "AA000" else f"Banco {c}")
+    df["C_10001000 - ACTIVO"] = rng.uniform(10, 1000, len(df))
+    df["R1 - Ratio (%)"] = rng.normal(5, 2, len(df))
+    df.loc[rng.random(len(df)) < 0.2, "R1 - Ratio (%)"] = np.nan   # entidades sin dato en algunos meses
+    df.loc[rng.random(len(df)) < 0.05, "C_10001000 - ACTIVO"] = np.nan
+    return df.sample(frac=0.9, random_state=1)                      # y algunas filas que no informaron
+
+
+def test_quantiles_match_pandas(long_df):
+    metrics = ["C_10001000 - ACTIVO", "R1 - Ratio (%)"]
+    cube = build_cube(long_df, metrics)
+    bench = compute_benchmarks(cube, benchmark_groups(cube, {"Pares": ["1", "2", "3", "00004"]}),
+                               weight="C_10001000 - ACTIVO")
+
+    no_aa = long_df[long_df["Codigo_norm"] != "AA000"]
+    pares = long_df[long_df["Codigo_norm"].isin(["00001", "00002", "00003", "00004"])]
+    for group, df in ((BENCH_ALL, no_aa), ("Pares", pares)):
+        for metric in metrics:
+            got = benchmark_series(bench, group, metric)
+            by_month = df.groupby("Mes")[metric]
+            expected = pd.DataFrame({"n": by_month.count(), "p25": by_month.quantile(0.25),
+                                     "mediana": by_month.median(), "p75": by_month.quantile(0.75)})
+            expected = expected[expected["n"] > 0]
+            pd.testing.assert_frame_equal(got[["n", "p25", "mediana", "p75"]], expected,
+                                          check_dtype=False, check_names=False, check_freq=False)
+
+
+def test_weighted_mean_and_aa_rows(long_df):
+    metrics = ["C_10001000 - ACTIVO", "R1 - Ratio (%)"]
+    cube = build_cube(long_df, metrics)
+    bench = compute_benchmarks(cube, benchmark_groups(cube), weight="C_10001000 - ACTIVO")
+
+    df = long_df[long_df["Codigo_norm"] != "AA000"].dropna(subset=["R1 - Ratio (%)", "C_10001000 - ACTIVO"])
+    w = df["C_10001000 - ACTIVO"]
+    expected = (df["R1 - Ratio (%)"] * w).groupby(df["Mes"]).sum() / w.groupby(df["Mes"]).sum()
+    got = benchmark_series(bench, BENCH_ALL, "R1 - Ratio (%)")["media_pond"]
+    np.testing.assert_allclose(got.to_numpy(), expected.reindex(got.index).to_numpy())
+
+    # cada fila AA es su propio grupo (por la etiqueta de la nómina): n = 1 y mediana = valor
+    aa = long_df[long_df["Codigo_norm"] == "AA000"].set_index("Mes")["R1 - Ratio (%)"].dropna().sort_index()
+    sistema = benchmark_series(bench, "Sistema", "R1 - Ratio (%)")
+    assert (sistema["n"] == 1).all()
+    np.testing.assert_allclose(sistema["mediana"].to_numpy(), aa.to_numpy())
+
+
+def test_nanquantiles_matches_numpy():
+    rng = np.random.default_rng(3)
+    v = rng.normal(size=(5, 17, 4))
+    v[rng.random(v.shape) < 0.3] = np.nan
+    v[2, :, 1] = np.nan
+    got = lib_data._nanquantiles(v, (0.1, 0.5, 0.9))
+    with np.errstate(all="ignore"), pytest.warns(RuntimeWarning):
+        expected = np.nanquantile(v, (0.1, 0.5, 0.9), axis=1)
+    np.testing.assert_allclose(got, expected, equal_nan=True)
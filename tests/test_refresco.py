@@ -0,0 +1,97 @@
+# tests/test_refresco.py
+import shutil
+import threading
+
+import pandas as pd
+import pytest
+
+import lib_data
+
+
+def test_refresh_swaps_version_without_blocking_readers(cache_dirs, data_copy, monkeypatch):
+    src = str(data_copy)
+    new_month = data_copy / "resultado Mayo.csv"
+    old = lib_data.current_dataset(src)
+    assert old.base["Mes"].max() == pd.Timestamp(2025, 4, 1)
+    cube = lib_data.load_cube(src, metrics=["C_10001000 - ACTIVO"])
+    assert old.derivados
+
+    # mayo 2025: copia de abril con otra fecha
+    text = (data_copy / "resultado Abril.csv").read_text(encoding="utf-8")
+    new_month.write_text(text.replace(",202504", ",202505"), encoding="utf-8")
+
+    building, release = threading.Event(), threading.Event()
+    build = lib_data._build_version
+
+    def slow_build(*args, **kwargs):
+        building.set()
+        release.wait(30)
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(lib_data, "_build_version", slow_build)
+    refresh = threading.Thread(target=lib_data.refresh_dataset, args=(src,))
+    refresh.start()
+    assert building.wait(30)
+    # mientras se arma la versión nueva se sigue sirviendo la anterior, sin esperar
+    assert lib_data.current_dataset(src) is old
+    assert lib_data.dataset_status(src)["refrescando"]
+    release.set()
+    refresh.join(30)
+
+    new = lib_data.current_dataset(src)
+    assert new is not old and new.version != old.version
+    assert new.base["Mes"].max() == pd.Timestamp(2025, 5, 1)
+    # la versión reemplazada sigue siendo válida para quien la tenía, y sus capas derivadas se liberan
+    assert old.base["Mes"].max() == pd.Timestamp(2025, 4, 1) and cube.values.shape[0] == 12
+    assert not old.derivados
+    assert lib_data.load_cube(src, metrics=["C_10001000 - ACTIVO"]).values.shape[0] == 13
+
+
+def test_unchanged_source_keeps_version(cache_dirs, data_copy):
+    src = str(data_copy)
+    first = lib_data.current_dataset(src)
+    assert not lib_data.refresh_dataset(src)
+    assert lib_data.current_dataset(src) is first
+    assert lib_data.dataset_status(src)["error"] is None
+
+
+def test_failed_refresh_keeps_serving(cache_dirs, data_copy, monkeypatch):
+    src = str(data_copy)
+    first = lib_data.current_dataset(src)
+    shutil.copy(data_copy / "resultado Abril.csv", data_copy / "resultado Abril 2.csv")
+
+    def broken(*args, **kwargs):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(lib_data, "_build_version", broken)
+    with pytest.warns(UserWarning, match="disco lleno"):
+        assert not lib_data.refresh_dataset(src)
+    assert lib_data.current_dataset(src) is first
+    assert "disco lleno" in lib_data.dataset_status(src)["error"]
+
+
+def test_sources_are_bounded_and_evicted_refreshers_stop(cache_dirs, data_copy, monkeypatch):
+    monkeypatch.setattr(lib_data, "REFRESH_MAX_SOURCES", 2)
+    src = str(data_copy)
+    first = lib_data.current_dataset(src)
+    lib_data.load_cube(src, metrics=["C_10001000 - ACTIVO"])
+    thread = lib_data._sources[lib_data._source_key(src)].thread
+    assert thread.is_alive() and first.derivados
+
+    # carpetas que no existen (escritas en la barra lateral) también cuentan
+    for name in ("no-existe-1", "no-existe-2"):
+        assert lib_data.current_dataset(str(cache_dirs / name)).base.empty
+    assert len(lib_data._sources) == 2
+    assert lib_data._source_key(src) not in lib_data._sources
+    thread.join(10)
+    assert not thread.is_alive() and not first.derivados
+
+    # la fuente descartada se vuelve a cargar si se la pide (desde el snapshot)
+    again = lib_data.current_dataset(src)
+    assert again is not first and again.huella == first.huella
+    assert lib_data._source_key(str(cache_dirs / "no-existe-1")) not in lib_data._sources
+
+
+def test_status_does_not_register_sources(cache_dirs):
+    status = lib_data.dataset_status(str(cache_dirs / "otra"))
+    assert status["version"] is None and not lib_data._sources
@@ -0,0 +1,73 @@
+# tests/test_snapshot.py
+import os
+
+import pandas as pd
+import pytest
+
+import lib_data
+
+ACTIVO = "C_10001000 - ACTIVO"
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Nombres de los CSV que se vuelven a leer en cada carga."""
+    seen = []
+    ingest = lib_data.ingest_local
+
+    def spy(paths, *args, **kwargs):
+        seen.extend(os.path.basename(p) for p in paths)
+        return ingest(paths, *args, **kwargs)
+
+    monkeypatch.setattr(lib_data, "ingest_local", spy)
+    return seen
+
+
+def _activo(full, mes, codigo="00007"):
+    row = full[(full["Mes"] == pd.Timestamp(mes)) & (full["Codigo_norm"] == codigo)]
+    return float(row[ACTIVO].iloc[0])
+
+
+def test_only_the_changed_file_is_reparsed(cache_dirs, data_copy, reads):
+    full, _ = lib_data._build_base(str(data_copy))
+    assert len(reads) == 12
+
+    path = data_copy / "resultado Marzo.csv"
+    text = path.read_text(encoding="utf-8")
+    old = f"{_activo(full, '2025-03-01'):.2f}"
+    assert old in text
+    path.write_text(text.replace(old, "1234.50", 1), encoding="utf-8")
+    os.utime(path, ns=(path.stat().st_mtime_ns + 10**9,) * 2)
+
+    reads.clear()
+    again, _ = lib_data._build_base(str(data_copy))
+    assert reads == ["resultado Marzo.csv"]
+    assert _activo(again, "2025-03-01") == 1234.5
+    assert _activo(again, "2025-04-01") == _activo(full, "2025-04-01")
+    assert len(again) == len(full)
+
+
+def test_unchanged_source_reads_nothing(cache_dirs, data_copy, reads):
+    full, _ = lib_data._build_base(str(data_copy))
+    reads.clear()
+    again, _ = lib_data._build_base(str(data_copy))
+    assert reads == []
+    pd.testing.assert_frame_equal(again, full)
+
+
+def test_deleted_file_drops_its_rows(cache_dirs, data_copy, reads):
+    lib_data._build_base(str(data_copy))
+    (data_copy / "resultado Enero.csv").unlink()
+    reads.clear()
+    full, _ = lib_data._build_base(str(data_copy))
+    assert reads == []
+    assert pd.Timestamp(2025, 1, 1) not in set(full["Mes"])
+    assert full["Mes"].nunique() == 11
+
+
+def test_snapshot_version_change_rereads_everything(cache_dirs, data_copy, reads, monkeypatch):
+    lib_data._build_base(str(data_copy))
+    monkeypatch.setattr(lib_data, "SNAPSHOT_VERSION", lib_data.SNAPSHOT_VERSION + 1)
+    reads.clear()
+    lib_data._build_base(str(data_copy))
+    assert len(reads) == 12
@@ -0,0 +1,80 @@
+# tests/test_transformaciones.py
+import numpy as np
+import pandas as pd
+import pytest
+
+import lib_data
+from lib_data import build_cube, transform_values
+
+NAN = np.nan
+
+
+def _long(values_by_month):
+    # una entidad y una métrica; los meses que no están en el dict no se informaron (hueco)
+    rows = [{"Mes": pd.Timestamp(m), "Codigo_norm": "00007", "Etiqueta": "Banco", "M": v}
+            for m, v in values_by_month.items()]
+    return pd.DataFrame(rows)
+
+
+def _transformed(values_by_month, transform):
+    cube = build_cube(_long(values_by_month), ["M"]).transformed(transform)
+    return pd.Series(cube.values[:, 0, 0], index=cube.months)
+
+
+# 2024-01..2024-06 sin 2024-04: el eje del cubo es denso, así que abril queda en NaN
+GAP = {"2024-01-01": 100.0, "2024-02-01": 110.0, "2024-03-01": 121.0, "2024-05-01": 130.0, "2024-06-01": 143.0}
+
+
+def test_cube_month_axis_is_dense():
+    cube = build_cube(_long(GAP), ["M"])
+    assert list(cube.months) == list(pd.date_range("2024-01-01", "2024-06-01", freq="MS"))
+    assert np.isnan(cube.values[3, 0, 0]) and not cube.present[3, 0]
+
+
+def test_monthly_change_never_skips_a_gap():
+    out = _transformed(GAP, "Var. % mensual")
+    np.testing.assert_allclose(out.to_numpy(), [NAN, 10.0, 10.0, NAN, NAN, 10.0])
+    # sin eje denso, mayo se compararía contra marzo
+    naive = pd.Series(GAP).pct_change() * 100
+    assert naive.iloc[3] == pytest.approx(130 / 121 * 100 - 100)
+
+
+def test_differences_and_rolling_mean_over_gap():
+    np.testing.assert_allclose(_transformed(GAP, "Dif. mensual").to_numpy(), [NAN, 10, 11, NAN, NAN, 13])
+    np.testing.assert_allclose(_transformed(GAP, "Promedio móvil 3 meses").to_numpy(),
+                               [NAN, NAN, 110.333333, NAN, NAN, NAN], rtol=1e-6)
+
+
+def test_year_over_year_uses_same_calendar_month():
+    months = pd.date_range("2023-01-01", "2024-12-01", freq="MS")
+    values = {m: float(i + 1) for i, m in enumerate(months) if m != pd.Timestamp(2023, 7, 1)}
+    out = _transformed(values, "Var. % interanual")
+    assert out.loc["2023-12-01":].notna().sum() == 11  # 2024-07 no tiene base (2023-07 falta)
+    assert np.isnan(out.loc["2024-07-01"])
+    assert out.loc["2024-03-01"] == pytest.approx((15 / 3 - 1) * 100)
+    np.testing.assert_allclose(_transformed(values, "Dif. interanual").loc["2024-01-01":].dropna(), 12.0)
+
+
+def test_year_to_date_restarts_in_january_and_breaks_on_gap():
+    values = {"2023-11-01": 1.0, "2023-12-01": 2.0, "2024-01-01": 3.0, "2024-02-01": 4.0, "2024-04-01": 5.0}
+    out = _transformed(values, "Acumulado del año")
+    # 2023: la ventana empieza antes del primer mes del cubo -> NaN; 2024 se corta en el hueco de marzo
+    np.testing.assert_allclose(out.to_numpy(), [NAN, NAN, 3.0, 7.0, NAN, NAN])
+
+
+def test_transform_values_matches_pandas_on_full_axis():
+    rng = np.random.default_rng(1)
+    months = pd.date_range("2020-01-01", periods=40, freq="MS")
+    v = rng.normal(100, 10, size=(40, 3, 2))
+    expected = pd.DataFrame(v[:, 1, :]).pct_change(12, fill_method=None).to_numpy() * 100
+    np.testing.assert_allclose(transform_values(v, "Var. % interanual", months)[:, 1, :], expected)
+    expected = pd.DataFrame(v[:, 2, :]).rolling(12).mean().to_numpy()
+    np.testing.assert_allclose(transform_values(v, "Promedio móvil 12 meses", months)[:, 2, :], expected)
+
+
+def test_real_uses_deflator(monkeypatch):
+    months = pd.date_range("2024-01-01", periods=3, freq="MS")
+    index = pd.Series([100.0, 110.0, 121.0], index=months)
+    monkeypatch.setattr(lib_data, "load_deflator", lambda path=None: index)
+    out = transform_values(np.array([[10.0], [11.0], [12.1]]), "Real (deflactado)", months)
+    np.testing.assert_allclose(out[:, 0], [12.1, 12.1, 12.1])